@@ -1,5 +1,9 @@
-from typing import Optional
+import os
+import socket
+import tempfile
+from typing import Literal, Optional
 
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,10 +14,80 @@ class Settings(BaseSettings):
 
     jinrishici_token: Optional[str] = None
     jinrishici_api_endpoint: str = "https://v2.jinrishici.com"
+    poem_pool_size: int = 10  # poems prefetched for the poem command
+    poem_pool_low_water: int = 3  # refill the pool once it is down to this many poems
+    poem_pool_refill_interval: float = 2.0  # seconds between api calls while refilling
 
     database_url: str = "sqlite+aiosqlite:///dominus.db"  # here an async database url must be used
+    database_pool_size: int = 5
+    database_max_overflow: int = 10  # postgresql only, like the settings below
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 60 * 30  # seconds
+    database_statement_cache_size: int = 100  # asyncpg prepared statements cached per connection
 
     enable_fxtwitter: bool = False
+    link_rewrites: dict[str, str] = {}  # domain to host links are rewritten to, as json in the environment
+    link_rewrite_cache_size: int = 1024  # links remembered over all channels, to not rewrite them again
+    link_rewrite_ttl: int = 60 * 10  # seconds a rewritten link is not rewritten again in the same channel
+
+    http_connection_limit: int = 100  # open connections of the http client, in total and per host
+    http_connection_limit_per_host: int = 8
+    http_dns_cache_ttl: int = 60 * 5  # seconds resolved host addresses are cached
+    http_keepalive_timeout: float = 30  # seconds an idle connection is kept open for reuse
+    http_connect_timeout: float = 5  # seconds to connect, a dead host fails fast
+    http_read_timeout: float = 15  # seconds to wait for the next chunk of a response
+    http_total_timeout: float = 60  # seconds a whole request may take, keep it well below feed_lease_ttl
+
+    feed_fetch_concurrency: int = 32  # max feeds fetched at the same time
+    feed_fetch_per_host_concurrency: int = 4  # max feeds fetched from the same host at the same time
+    feed_parser_executor: Literal["thread", "process"] = "thread"  # process pool parses on all cores
+    feed_parser_workers: int = 4
+    feed_max_body_size: int = 5 * 1024 * 1024  # bytes, larger feeds are rejected
+    feed_max_entries: Optional[int] = None  # only parse the first n entries of a feed
+    feed_cache_ttl: int = 60  # seconds a fetched feed is reused by later fetches of the url, 0 disables it
+    feed_cache_size: int = 128  # fetched feeds kept
+    feed_seen_entries_retention: int = 500  # seen entry hashes kept per feed to detect new entries
+    feed_entry_index_retention: int = 100  # entries per feed kept for /dominus feed search, 0 disables the index
+    feed_entry_summary_length: int = 500  # characters of an entry summary kept in the index
+    feed_max_new_entries: int = 10  # new entries posted per feed and poll at most
+    feed_poll_min_interval: int = 60 * 5  # seconds, bounds of the adaptive per-feed poll interval
+    feed_poll_max_interval: int = 60 * 60 * 6
+    feed_failure_threshold: int = 6  # failing feeds are retried with exponential backoff, until this many failures
+    feed_circuit_open_interval: int = 60 * 60 * 24  # seconds between retries of a feed beyond the threshold
+
+    # every bot and poller process leases due feeds from the database, so feeds are split between them
+    worker_id: str = Field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}")
+    # leases are renewed while a cycle runs, so a cycle may take longer than the ttl, e.g. a batch of urls of one
+    # host takes about batch / per-host concurrency rounds of fetches, each up to http_total_timeout
+    feed_lease_ttl: int = 60 * 10  # seconds, feeds of a crashed worker are picked up after this
+    feed_lease_batch: int = 500  # urls leased per poll
+
+    feed_list_page_size: int = 20  # feeds per page of /dominus feed list
+    feed_search_results: int = 10  # entries listed by /dominus feed search
+
+    channel_cache_size: int = 1024  # fetched discord channels kept when not in the gateway cache
+    channel_cache_ttl: int = 60 * 60  # seconds
+
+    delivery_workers: int = 4  # concurrent discord senders of feed notifications
+    delivery_channel_rate: float = 1.0  # messages per second and burst per channel, below the discord limit
+    delivery_channel_burst: int = 5
+    delivery_global_rate: float = 40.0  # messages per second over all channels
+
+    metrics_port: Optional[int] = None  # serve prometheus metrics at /metrics on this port, off by default
+    metrics_host: str = "127.0.0.1"
+    metrics_slow_feed_seconds: float = 10  # feed fetches and parses slower than this are logged with the url
+
+    profile_top: int = 30  # functions and allocation sites in a poll cycle profile report
+    profile_dir: str = tempfile.gettempdir()  # where profiles triggered by SIGUSR1 are written
+
+    # feeds advertising a websub hub are pushed to a callback server instead of being polled, off by default
+    websub_callback_url: Optional[str] = None  # public url of the callback server, e.g. https://dominus.example.com
+    websub_host: str = "127.0.0.1"  # address the callback server listens on, behind the public url
+    websub_port: int = 8090
+    websub_lease_seconds: int = 60 * 60 * 24 * 7  # lease asked from hubs, hubs may grant another
+    websub_renew_margin: int = 60 * 60 * 24  # seconds before the lease ends that a subscription is renewed
+    websub_retry_interval: int = 60 * 60 * 6  # seconds before a subscription the hub did not verify is asked again
+    websub_poll_interval: int = 60 * 60 * 6  # seconds, pushed feeds are still polled this often in case a push is lost
 
 
 settings = Settings()  # type: ignore
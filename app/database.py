@@ -1,7 +1,66 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config.settings import settings
 
-engine = create_async_engine(settings.database_url)
-async_session = lambda: AsyncSession(engine)
+engine: AsyncEngine | None = None
+# bound to the engine by start_database()
+async_session = async_sessionmaker(class_=AsyncSession)
+
+
+def engine_options(database_url: str) -> dict[str, Any]:
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return {
+            "pool_size": settings.database_pool_size,
+            "max_overflow": settings.database_max_overflow,
+            "pool_pre_ping": settings.database_pool_pre_ping,
+            "pool_recycle": settings.database_pool_recycle,
+            "connect_args": {"prepared_statement_cache_size": settings.database_statement_cache_size},
+        }
+    if backend == "sqlite" and url.database not in (None, "", ":memory:"):
+        # aiosqlite opens a new connection per session by default (NullPool), keep a few open and shared
+        # between sessions instead, writers wait for the lock rather than failing
+        return {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": settings.database_pool_size,
+            "max_overflow": 0,
+            "connect_args": {"timeout": 30},
+        }
+    return {}
+
+
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    # readers do not block the writer in WAL mode, NORMAL sync is safe with WAL and avoids a fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+async def start_database():
+    """
+    Create the engine and open its first connection, so the first query does not wait for it.
+    """
+    global engine
+    if engine is not None:
+        return
+    engine = create_async_engine(settings.database_url, **engine_options(settings.database_url))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragma)
+    async_session.configure(bind=engine)
+    async with engine.connect():
+        pass
+
+
+async def close_database():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
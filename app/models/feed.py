@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlmodel import Field, SQLModel, UniqueConstraint
+from sqlmodel import BigInteger, Field, SQLModel, UniqueConstraint
 
 
 class Feed(SQLModel, table=True):
@@ -10,5 +10,53 @@ class Feed(SQLModel, table=True):
     url: str = Field(index=True)
     channel_id: int = Field(index=True)
     last_checked: datetime = Field(default_factory=datetime.utcnow)
+    etag: Optional[str] = Field(default=None)  # validators of the last full response, for conditional GET
+    last_modified: Optional[str] = Field(default=None)
+    next_poll_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    poll_interval: int = Field(default=300)  # seconds, adapted to how often the feed is updated
+    lease_owner: Optional[str] = Field(default=None)  # worker polling the feed right now
+    lease_expires_at: Optional[datetime] = Field(default=None)
+    consecutive_failures: int = Field(default=0)  # failed fetches in a row, next_poll_at is the next retry then
+    last_error: Optional[str] = Field(default=None)
 
     __table_args__ = (UniqueConstraint("url", "channel_id", name="unique_item_url_channel_id"),)
+
+
+class SeenEntry(SQLModel, table=True):
+    """
+    Hash of an entry already seen in a feed, the newest rows per url are kept.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    url: str = Field()
+    entry_hash: int = Field(sa_type=BigInteger)
+
+    __table_args__ = (UniqueConstraint("url", "entry_hash", name="unique_seen_entry_url_hash"),)
+
+
+class FeedEntry(SQLModel, table=True):
+    """
+    Entry of a feed kept for search, the newest rows per url are kept. On SQLite the feedentry_fts
+    FTS5 table created by the migration indexes the title and summary, kept in sync by triggers.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    url: str = Field(index=True)
+    title: str = Field()
+    link: str = Field()
+    summary: str = Field()
+    published: Optional[datetime] = Field(default=None)
+
+
+class WebSubscription(SQLModel, table=True):
+    """
+    WebSub subscription of a feed url at its hub, the lease is unset until the hub verified it.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    url: str = Field(unique=True)  # feed url as subscribed in channels
+    hub: str = Field()
+    topic: str = Field()
+    secret: str = Field()  # key of the HMAC signature of the pushed content
+    requested_at: datetime = Field(default_factory=datetime.utcnow)
+    lease_expires_at: Optional[datetime] = Field(default=None)
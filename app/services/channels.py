@@ -0,0 +1,52 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+import aiohttp
+import nextcord
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelResolver:
+    """
+    Resolve channel ids without a REST call when possible: the gateway cache is tried first,
+    then a TTL-bounded LRU of fetched channels. Missing channels are cached as None as well,
+    so a deleted channel is not fetched again on every poll.
+    """
+
+    def __init__(self, client: nextcord.Client):
+        self.client = client
+        self._cache: OrderedDict[int, tuple[float, Any]] = OrderedDict()
+
+    async def resolve(self, channel_id: int) -> Any:
+        if channel := self.client.get_channel(channel_id):
+            return channel
+
+        if cached := self._cache.get(channel_id):
+            expires_at, channel = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(channel_id)
+                return channel
+            del self._cache[channel_id]
+
+        try:
+            channel = await self.client.fetch_channel(channel_id)
+        except (nextcord.NotFound, nextcord.Forbidden) as e:
+            logger.warning(f"channel {channel_id} is not available: {e}")
+            channel = None
+        except (nextcord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # discord failed to answer, skip the channel this time without caching it
+            logger.warning(f"channel {channel_id} could not be fetched: {e!r}")
+            return None
+        self._cache[channel_id] = (time.monotonic() + settings.channel_cache_ttl, channel)
+        if len(self._cache) > settings.channel_cache_size:
+            self._cache.popitem(last=False)
+        return channel
+
+    def invalidate(self, channel_id: int):
+        self._cache.pop(channel_id, None)
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from app.config.settings import settings
+from app.services.metrics import DISCORD_SEND_ERRORS, DISCORD_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000  # discord message content length limit
+
+
+class TokenBucket:
+    """
+    Allow `rate` operations per second on average and bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """
+        Take a token and return 0, or return the seconds until one is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+def combine(lines: list[str]) -> list[str]:
+    """
+    Join lines into as few messages as the message length limit allows.
+    """
+    messages: list[str] = []
+    for line in lines:
+        line = line[:MESSAGE_LIMIT]
+        if messages and len(messages[-1]) + 1 + len(line) <= MESSAGE_LIMIT:
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line)
+    return messages
+
+
+class DeliveryQueue:
+    """
+    Outbound message queue, so fetching never waits on discord. Messages for the same channel are combined,
+    and sends are paced by a per-channel and a global token bucket to stay below discord rate limits.
+    """
+
+    def __init__(self):
+        self._pending: dict[int, list[str]] = {}
+        self._channels: dict[int, Any] = {}
+        self._buckets: dict[int, TokenBucket] = {}
+        self._global = TokenBucket(settings.delivery_global_rate, settings.delivery_global_rate)
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+
+    def send(self, channel: Any, content: str):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.delivery_workers)]
+        if channel.id not in self._pending:
+            self._pending[channel.id] = []
+            self._ready.put_nowait(channel.id)
+        self._pending[channel.id].append(content)
+        self._channels[channel.id] = channel
+
+    async def _worker(self):
+        while True:
+            channel_id = await self._ready.get()
+            if channel_id not in self._buckets:
+                self._buckets[channel_id] = TokenBucket(settings.delivery_channel_rate, settings.delivery_channel_burst)
+            if wait := self._buckets[channel_id].delay():
+                # the channel is throttled, let the other channels go first
+                asyncio.get_running_loop().call_later(wait, self._ready.put_nowait, channel_id)
+                continue
+            while wait := self._global.delay():
+                await asyncio.sleep(wait)
+
+            # everything queued for the channel so far goes out together, the rest waits for a new token
+            messages = combine(self._pending[channel_id])
+            channel = self._channels[channel_id]
+            if len(messages) > 1:
+                self._pending[channel_id] = messages[1:]
+                self._ready.put_nowait(channel_id)
+            else:
+                del self._pending[channel_id]
+                del self._channels[channel_id]
+            try:
+                with DISCORD_SEND_SECONDS.time():
+                    await channel.send(content=messages[0])
+            except Exception as e:
+                DISCORD_SEND_ERRORS.inc()
+                logger.error(f"failed to send message to channel {channel_id}: {e}", exc_info=True)
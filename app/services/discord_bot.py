@@ -1,70 +1,62 @@
 import asyncio
 import io
 import logging
-import re
-import traceback
+import time
 import urllib.parse
 from datetime import datetime
-from time import mktime
 
 import nextcord
 from nextcord.ext import application_checks, commands
 
 from app.config.settings import settings
+from app.database import close_database, start_database
+from app.services.delivery import MESSAGE_LIMIT
 from app.services.feed import (
-    get_all_channel_ids,
+    FeedPage,
+    count_feeds,
+    get_feed_page,
     get_feeds_by_channel,
+    read_opml,
+    search_entries,
     subscribe_feed,
+    subscribe_feeds,
     unsubscribe_feed,
-    update_last_checked,
 )
 from app.services.http_api import HTTPService
+from app.services.link_rewriter import LinkRewriter, configured_rules
+from app.services.poems import PoemPool
+from app.services.poller import FeedPoller
 
 logger = logging.getLogger(__name__)
 http_service = HTTPService()
+link_rewriter = LinkRewriter(configured_rules())
+poem_pool = PoemPool(http_service)
+
+FEED_LIST_TIMEOUT = 180  # seconds the buttons of a feed list work
 
 
 class Bot(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.poller = FeedPoller(self, http_service)
+        self.started_at = time.perf_counter()
 
         # create the background task and run it in the background
         self.bg_task = self.loop.create_task(self.rss_task())
 
+    async def start(self, *args, **kwargs):
+        self.started_at = time.perf_counter()
+        await asyncio.gather(http_service.start(), start_database())
+        logger.info(f"http client and database started in {time.perf_counter() - self.started_at:.3f}s")
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        await super().close()
+        await asyncio.gather(http_service.close(), close_database())
+
     async def rss_task(self):
         await self.wait_until_ready()
-        while not self.is_closed():
-            try:
-                channel_ids = await get_all_channel_ids()
-                for channel_id in channel_ids:
-                    channel = await self.fetch_channel(channel_id)
-                    if channel:
-                        feeds = await get_feeds_by_channel(channel_id)
-                        for _feed in feeds.feeds:
-                            feed = await http_service.fetch_feed(_feed.url)
-                            if feed.error:
-                                # here should delete feed or notify user
-                                logger.error(f"Invalid feed url: {_feed.url}")
-                                continue
-                            if e := feed.feed.entries:
-                                entry = e[0]
-                                dt = entry.get("published_parsed") or entry.get("updated_parsed")  # rss, aotm
-                                published = datetime.fromtimestamp(mktime(dt)) if dt else datetime.utcnow()
-                                logger.info(f"checking feed: {_feed.url}, last_updated: {_feed.last_checked}")
-                                if (not _feed.last_checked) or published > _feed.last_checked:
-                                    logger.info(f"New entry found in: {_feed.url}, last_checked: {_feed.last_checked}")
-                                    await channel.send(
-                                        content=f":newspaper2: New feed from **{_feed.title}**!\n{entry.link}"
-                                    )
-                                    res = await update_last_checked(_feed.id)
-                                    logger.info(f"update last_checked: {res}")
-            except Exception as e:  # handle all exceptions here to avoid task hang
-                info = await self.application_info()
-                channel = await self.create_dm(info.owner)
-                await channel.send(f"```feed task error: {traceback.format_exc()}```")
-                logger.error(f"feed task error: {e}", exc_info=True)
-            logger.info("feed task finished, sleep 5 min")
-            await asyncio.sleep(60 * 5)  # 5m
+        await self.poller.run()
 
 
 intents = nextcord.Intents.default()
@@ -74,21 +66,31 @@ bot = Bot(intents=intents)
 
 @bot.event
 async def on_ready():
-    logger.info(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    logger.info(
+        f"Logged in as {bot.user} (ID: {bot.user.id}), ready {time.perf_counter() - bot.started_at:.3f}s after start"
+    )
+    if settings.jinrishici_token:
+        poem_pool.refill()
+
+
+@bot.event
+async def on_guild_channel_delete(channel: nextcord.abc.GuildChannel):
+    bot.poller.channels.invalidate(channel.id)
 
 
-def process_twitter_urls(text):
-    pattern = r"https?://(?:twitter\.com|x\.com)/(\w+)/status/(\d+)"
-    urls = []
-    users = []
+@bot.event
+async def on_guild_channel_update(before: nextcord.abc.GuildChannel, after: nextcord.abc.GuildChannel):
+    bot.poller.channels.invalidate(after.id)
 
-    for match in re.finditer(pattern, text):
-        user, tweet_id = match.groups()
-        replaced_url = f"https://fxtwitter.com/{user}/status/{tweet_id}"
-        urls.append(replaced_url)
-        users.append(user)
 
-    return urls, users
+@bot.event
+async def on_thread_delete(thread: nextcord.Thread):
+    bot.poller.channels.invalidate(thread.id)
+
+
+@bot.event
+async def on_thread_update(before: nextcord.Thread, after: nextcord.Thread):
+    bot.poller.channels.invalidate(after.id)
 
 
 @bot.event
@@ -97,13 +99,12 @@ async def on_message(message: nextcord.Message):
         return
 
     assert bot.user
-    if settings.enable_fxtwitter:
-        urls, users = process_twitter_urls(message.content)
-        if not urls:
-            return
-        async with message.channel.typing():
-            await message.add_reaction("💬")
-            await message.channel.send(content=f":bird: [Tweet • {users[0]}]({urls[0]})")
+    lines = link_rewriter.rewrite(message.channel.id, message.content)
+    if not lines:
+        return
+    async with message.channel.typing():
+        await message.add_reaction("💬")
+        await message.channel.send(content="\n".join(lines)[:MESSAGE_LIMIT])
 
 
 @bot.slash_command(description="dominus main command")
@@ -175,6 +176,60 @@ async def sub_feed(
     await interaction.followup.send(content=f"**Failed to subscribe:** {sr.error}", delete_after=10)
 
 
+@feed.subcommand(description="import rss feeds from an opml file", name="import")
+@application_checks.is_owner()
+async def import_feed(
+    interaction: nextcord.Interaction,
+    file: nextcord.Attachment = nextcord.SlashOption(description="an opml file", required=True),
+):
+    """
+    This is a subcommand of the '/dominus feed' command.
+    It will appear in the menu as '/dominus feed import'.
+    """
+    await interaction.response.defer(ephemeral=True)
+    assert interaction.channel
+    if file.size > settings.feed_max_body_size:
+        return await interaction.followup.send(
+            embed=nextcord.Embed(description="The opml file is too large", color=nextcord.Color.red()), delete_after=10
+        )
+    from xml.etree import ElementTree
+
+    try:
+        feeds = read_opml(await file.read())
+    except ElementTree.ParseError as e:
+        return await interaction.followup.send(
+            embed=nextcord.Embed(description=f"Not a valid opml file: {e}", color=nextcord.Color.red()), delete_after=10
+        )
+
+    # fetch the new feeds concurrently, within the same limits as the poller
+    subscribed = {s.url for s in (await get_feeds_by_channel(interaction.channel.id)).feeds}
+    urls = [url for url in feeds if url not in subscribed]
+
+    async def validate(url: str) -> tuple[str | None, str | None]:
+        # only the error and the title, the parsed feeds are not kept until all fetches are done
+        async with bot.poller.limiter.acquire(url):
+            response = await http_service.fetch_feed(url)
+        return response.error, None if response.error else response.feed.feed.get("title")
+
+    failed = {}
+    for url, (error, title) in zip(urls, await asyncio.gather(*(validate(url) for url in urls))):
+        if error:
+            failed[url] = error
+        elif feeds[url] == url:  # the outline has no title
+            feeds[url] = title or url
+    ir = await subscribe_feeds({url: feeds[url] for url in urls if url not in failed}, interaction.channel.id)
+
+    lines = [
+        f"**Imported {len(ir.added)} feeds**, {len(feeds) - len(urls) + len(ir.existing)} already subscribed, "
+        f"{len(failed)} failed."
+    ]
+    lines.extend(f"- {url}: {error}" for url, error in failed.items())
+    content = "\n".join(lines)
+    await interaction.followup.send(
+        content=content if len(content) <= MESSAGE_LIMIT else content[: MESSAGE_LIMIT - 3] + "..."
+    )
+
+
 @feed.subcommand(description="unsubscribe a rss feed", name="unsub")
 @application_checks.is_owner()
 async def unsub_feed(
@@ -197,6 +252,53 @@ async def unsub_feed(
     await interaction.followup.send(content=f"**Failed to unsubscribe:** {sr.error}", delete_after=10)
 
 
+class FeedListView(nextcord.ui.View):
+    """
+    Previous and next buttons of a page of /dominus feed list, pages are fetched by keyset on the feed id.
+    """
+
+    def __init__(self, channel_id: int, total: int, page: FeedPage):
+        super().__init__(timeout=FEED_LIST_TIMEOUT)
+        self.channel_id = channel_id
+        self.total = total
+        self.number = 0  # zero based page number
+        self.show(page)
+
+    def show(self, page: FeedPage):
+        self.page = page
+        self.prev_page.disabled = not page.has_prev
+        self.next_page.disabled = not page.has_next
+
+    def content(self) -> str:
+        start = self.number * settings.feed_list_page_size
+        pages = -(-self.total // settings.feed_list_page_size)
+        lines = [
+            f"{i}. [{s.title}]({s.url})" + (" :warning:" if s.consecutive_failures else "")
+            for i, s in enumerate(self.page.feeds, start + 1)
+        ]
+        lines.append(f"Page {self.number + 1}/{max(pages, self.number + 1)}, {self.total} feeds")
+        content = "\n".join(lines)
+        return content if len(content) <= MESSAGE_LIMIT else content[: MESSAGE_LIMIT - 3] + "..."
+
+    @nextcord.ui.button(label="Previous", style=nextcord.ButtonStyle.secondary)
+    async def prev_page(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        page = await get_feed_page(self.channel_id, settings.feed_list_page_size, before=self.page.feeds[0].id)
+        await self.turn(interaction, page, -1)
+
+    @nextcord.ui.button(label="Next", style=nextcord.ButtonStyle.secondary)
+    async def next_page(self, button: nextcord.ui.Button, interaction: nextcord.Interaction):
+        page = await get_feed_page(self.channel_id, settings.feed_list_page_size, after=self.page.feeds[-1].id)
+        await self.turn(interaction, page, 1)
+
+    async def turn(self, interaction: nextcord.Interaction, page: FeedPage, step: int):
+        if not page.feeds:  # the feeds of the page were unsubscribed meanwhile, start over
+            self.number, page = 0, await get_feed_page(self.channel_id, settings.feed_list_page_size)
+        else:
+            self.number = max(self.number + step, 0)
+        self.show(page)
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+
 @feed.subcommand(description="list rss feeds", name="list")
 async def list_feed(interaction: nextcord.Interaction):
     """
@@ -205,13 +307,35 @@ async def list_feed(interaction: nextcord.Interaction):
     """
     await interaction.response.defer(ephemeral=True)
     assert interaction.channel
-    feeds = await get_feeds_by_channel(interaction.channel.id)
-    if feeds.feeds:
+    page = await get_feed_page(interaction.channel.id, settings.feed_list_page_size)
+    if page.feeds:
+        view = FeedListView(interaction.channel.id, await count_feeds(interaction.channel.id), page)
+        return await interaction.followup.send(content=view.content(), view=view, delete_after=FEED_LIST_TIMEOUT)
+    await interaction.followup.send(content="No feed found", delete_after=10)
+
+
+@feed.subcommand(description="search the entries of the rss feeds", name="search")
+async def search_feed(
+    interaction: nextcord.Interaction,
+    query: str = nextcord.SlashOption(description="words to search for", required=True),
+):
+    """
+    This is a subcommand of the '/dominus feed' command.
+    It will appear in the menu as '/dominus feed search'.
+    """
+    await interaction.response.defer(ephemeral=True)
+    assert interaction.channel
+    entries = await search_entries(interaction.channel.id, query, settings.feed_search_results)
+    if entries:
+        content = "\n".join(
+            f"{i}. [{e.title or e.link}]({e.link})" + (f" ({e.published:%Y-%m-%d})" if e.published else "")
+            for i, e in enumerate(entries, 1)
+        )
         return await interaction.followup.send(
-            content="\n".join([f"{i}. [{s.title}]({s.url})" for i, s in enumerate(feeds.feeds, 1)]),
-            delete_after=30,
+            content=content if len(content) <= MESSAGE_LIMIT else content[: MESSAGE_LIMIT - 3] + "...",
+            delete_after=FEED_LIST_TIMEOUT,
         )
-    await interaction.followup.send(content="No feed found", delete_after=10)
+    await interaction.followup.send(content="No entry found", delete_after=10)
 
 
 @feed.subcommand(description="export rss feeds to opml file", name="export")
@@ -233,6 +357,31 @@ async def export_feed(interaction: nextcord.Interaction):
     await interaction.followup.send(content="No feed found", delete_after=10)
 
 
+@dominus.subcommand(description="debug subcommand")
+async def debug(interaction: nextcord.Interaction):
+    """
+    This is the second slash command that will be the prefix of all commands below.
+    This will never get called since it has subcommands.
+    """
+
+
+@debug.subcommand(description="profile the next rss feed poll cycle", name="profile")
+@application_checks.is_owner()
+async def profile_poll(interaction: nextcord.Interaction):
+    """
+    This is a subcommand of the '/dominus debug' command.
+    It will appear in the menu as '/dominus debug profile'.
+    """
+    await interaction.response.defer(ephemeral=True)
+    report = await bot.poller.profile_next_cycle()
+    await interaction.followup.send(
+        content="Here is the poll cycle profile",
+        file=nextcord.File(
+            io.BytesIO(report.encode()), filename=f"profile_{datetime.utcnow().strftime('%Y%m%d%H%M')}.txt"
+        ),
+    )
+
+
 if settings.jinrishici_token:
     logger.info("random_poem command enabled")
 
@@ -244,7 +393,7 @@ if settings.jinrishici_token:
         """
         logger.info("random_poem command called")
         await interaction.response.defer()
-        js = await http_service.jinrishici_sentence()
+        js = await poem_pool.get()
         if not js.error:
             embed = nextcord.Embed(
                 title=js.title,
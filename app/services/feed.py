@@ -1,12 +1,16 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Sequence
+from itertools import groupby
+from typing import Any, Optional, Sequence
 
-from opml import OpmlDocument  # type: ignore
-from sqlmodel import select
+from sqlalchemy import bindparam, column, table
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import and_, delete, func, insert, or_, select, text, update
 
+from app import database
 from app.database import async_session
-from app.models.feed import Feed
+from app.models.feed import Feed, FeedEntry, SeenEntry, WebSubscription
+from app.services.metrics import observe_query
 
 
 @dataclass
@@ -16,6 +20,7 @@ class FeedResult:
     error: Optional[str] = None
 
 
+@observe_query
 async def subscribe_feed(title: str, url: str, channel_id: int) -> FeedResult:
     async with async_session() as session:
         query = select(Feed).where(Feed.url == url, Feed.channel_id == channel_id)
@@ -33,18 +38,69 @@ async def subscribe_feed(title: str, url: str, channel_id: int) -> FeedResult:
         return FeedResult(success=True, feed=new_feed)
 
 
+@dataclass
+class ImportResult:
+    added: list[str]
+    existing: list[str]
+
+
+def read_opml(data: bytes) -> dict[str, str]:
+    """
+    Feed urls and titles of an OPML document, of any version and with nested outlines.
+    """
+    from xml.etree import ElementTree
+
+    feeds: dict[str, str] = {}
+    for outline in ElementTree.fromstring(data).iter("outline"):
+        if url := (outline.get("xmlUrl") or "").strip():
+            feeds.setdefault(url, outline.get("title") or outline.get("text") or url)
+    return feeds
+
+
+@observe_query
+async def subscribe_feeds(feeds: dict[str, str], channel_id: int) -> ImportResult:
+    """
+    Subscribe a channel to many feeds, given as url to title, in one transaction.
+    """
+    async with async_session() as session:
+        query = select(Feed.url).where(Feed.channel_id == channel_id, Feed.url.in_(feeds))  # type: ignore
+        existing = set((await session.exec(query)).all())
+        added = [url for url in feeds if url not in existing]
+        rows = [{"title": feeds[url], "url": url, "channel_id": channel_id} for url in added]
+        try:
+            if rows:
+                await session.exec(insert(Feed), params=rows)  # type: ignore
+                await session.commit()
+        except IntegrityError:
+            # some were subscribed meanwhile, e.g. with /dominus feed sub, add the others one by one
+            await session.rollback()
+            added = []
+            for row in rows:
+                try:
+                    await session.exec(insert(Feed), params=[row])  # type: ignore
+                    await session.commit()
+                    added.append(row["url"])
+                except IntegrityError:
+                    await session.rollback()
+                    existing.add(row["url"])
+        return ImportResult(added=added, existing=[url for url in feeds if url in existing])
+
+
 @dataclass
 class FeedsWithOpml:
     feeds: Sequence[Feed]
     opml: str
 
 
+@observe_query
 async def get_feeds_by_channel(channel_id: int, return_opml=False) -> FeedsWithOpml:
     async with async_session() as session:
         query = select(Feed).where(Feed.channel_id == channel_id)
         result = await session.exec(query)
         feeds = result.all()
         if return_opml:
+            from opml import OpmlDocument  # type: ignore  # only needed for exports
+
             document = OpmlDocument()
             for feed in feeds:
                 document.add_rss(
@@ -57,34 +113,276 @@ async def get_feeds_by_channel(channel_id: int, return_opml=False) -> FeedsWithO
         return FeedsWithOpml(feeds=feeds, opml="")
 
 
-async def get_all_channel_ids() -> Sequence[int]:
+@dataclass
+class FeedPage:
+    feeds: list[Feed]
+    has_prev: bool
+    has_next: bool
+
+
+@observe_query
+async def get_feed_page(
+    channel_id: int, limit: int, after: Optional[int] = None, before: Optional[int] = None
+) -> FeedPage:
+    """
+    Up to `limit` feeds of a channel ordered by id, starting after or ending before the given id.
+    Keyset pagination, so any page costs the same however far into the list it is.
+    """
     async with async_session() as session:
-        query = select(Feed.channel_id).distinct()
-        result = await session.exec(query)
+        query = select(Feed).where(Feed.channel_id == channel_id)
+        if before is not None:
+            query = query.where(Feed.id < before).order_by(Feed.id.desc())  # type: ignore
+        else:
+            if after is not None:
+                query = query.where(Feed.id > after)
+            query = query.order_by(Feed.id)  # type: ignore
+        feeds = list((await session.exec(query.limit(limit + 1))).all())
+    more = len(feeds) > limit
+    feeds = feeds[:limit]
+    if before is not None:
+        return FeedPage(feeds=feeds[::-1], has_prev=more, has_next=True)
+    return FeedPage(feeds=feeds, has_prev=after is not None, has_next=more)
+
+
+@observe_query
+async def count_feeds(channel_id: int) -> int:
+    async with async_session() as session:
+        result = await session.exec(select(func.count()).select_from(Feed).where(Feed.channel_id == channel_id))
+        return result.one()
+
+
+def unleased(now: datetime):
+    return or_(Feed.lease_expires_at.is_(None), Feed.lease_expires_at < now)  # type: ignore
+
+
+async def leased_feeds(session: Any, result: Any) -> Sequence[Feed]:
+    """
+    The rows a leasing UPDATE ... RETURNING took, and only those: the bot polls and receives websub pushes
+    with the same owner, rows it already holds for one of them must not be handed to the other.
+    """
+    feeds = result.scalars().all()
+    session.expunge_all()  # keep them loaded, the commit would expire them
+    await session.commit()
+    return feeds
+
+
+@observe_query
+async def lease_due_feeds(owner: str, now: datetime, lease_expires_at: datetime, limit: int) -> Sequence[Feed]:
+    """
+    Lease the subscriptions of up to `limit` due urls to a worker. The lease is taken by a single UPDATE,
+    so concurrent workers never get the same feed, and an expired lease can be taken over by any worker.
+    All subscriptions of a url are leased once one of them is due, so the url is fetched once for all of them
+    and they are scheduled together again, e.g. a new subscription to a url that is already polled.
+    """
+    async with async_session() as session:
+        due = and_(Feed.next_poll_at <= now, unleased(now))  # type: ignore
+        urls = select(Feed.url).where(due).group_by(Feed.url).order_by(func.min(Feed.next_poll_at)).limit(limit)
+        query = update(Feed).where(unleased(now), Feed.url.in_(urls)).returning(Feed)  # type: ignore
+        result = await session.exec(query.values(lease_owner=owner, lease_expires_at=lease_expires_at))
+        return await leased_feeds(session, result)
+
+
+@observe_query
+async def renew_leases(owner: str, feed_ids: Sequence[int], now: datetime, lease_expires_at: datetime):
+    """
+    Extend the leases a worker still holds on the given feeds.
+    """
+    async with async_session() as session:
+        query = update(Feed).where(
+            Feed.id.in_(feed_ids), Feed.lease_owner == owner, Feed.lease_expires_at > now  # type: ignore
+        )
+        await session.exec(query.values(lease_expires_at=lease_expires_at))
+        await session.commit()
+
+
+@observe_query
+async def lease_url(owner: str, url: str, now: datetime, lease_expires_at: datetime) -> Sequence[Feed]:
+    """
+    Lease the subscriptions of a url, or none if another worker holds the lease, e.g. to poll it right now.
+    """
+    async with async_session() as session:
+        query = update(Feed).where(Feed.url == url, unleased(now)).returning(Feed)  # type: ignore
+        result = await session.exec(query.values(lease_owner=owner, lease_expires_at=lease_expires_at))
+        return await leased_feeds(session, result)
+
+
+@observe_query
+async def get_next_poll_at(now: datetime) -> Optional[datetime]:
+    async with async_session() as session:
+        result = await session.exec(select(func.min(Feed.next_poll_at)).where(unleased(now)))
+        return result.one()
+
+
+@observe_query
+async def get_seen_entries(urls: Sequence[str]) -> dict[str, set[int]]:
+    seen: dict[str, set[int]] = {url: set() for url in urls}
+    async with async_session() as session:
+        query = select(SeenEntry.url, SeenEntry.entry_hash).where(SeenEntry.url.in_(urls))  # type: ignore
+        for url, entry_hash in await session.exec(query):
+            seen[url].add(entry_hash)
+    return seen
+
+
+@observe_query
+async def get_websubs(urls: Sequence[str]) -> dict[str, WebSubscription]:
+    async with async_session() as session:
+        result = await session.exec(select(WebSubscription).where(WebSubscription.url.in_(urls)))  # type: ignore
+        return {websub.url: websub for websub in result}
+
+
+@observe_query
+async def get_websub(websub_id: int) -> Optional[WebSubscription]:
+    async with async_session() as session:
+        return await session.get(WebSubscription, websub_id)
+
+
+@observe_query
+async def get_websubs_to_renew(renew_before: datetime, requested_before: datetime) -> Sequence[WebSubscription]:
+    """
+    Subscriptions that are unverified or whose lease ends before `renew_before`, and were last requested
+    before `requested_before`, so a hub that does not answer is asked again only once per retry interval.
+    """
+    async with async_session() as session:
+        expiring = or_(WebSubscription.lease_expires_at.is_(None), WebSubscription.lease_expires_at < renew_before)
+        query = select(WebSubscription).where(expiring, WebSubscription.requested_at < requested_before)
+        result = await session.exec(query)  # type: ignore
         return result.all()
 
 
-async def update_last_checked(feed_id: int) -> FeedResult:
+@observe_query
+async def save_websub(url: str, hub: str, topic: str, secret: str) -> WebSubscription:
+    """
+    Record a subscription request for a url, a renewal keeps the current lease until the hub verifies it.
+    """
     async with async_session() as session:
-        query = select(Feed).where(Feed.id == feed_id)
-        result = await session.exec(query)
-        feed = result.one_or_none()
-        if feed:
-            feed.last_checked = datetime.utcnow()
-            session.add(feed)
+        websub = (await session.exec(select(WebSubscription).where(WebSubscription.url == url))).one_or_none()
+        if websub is None:
+            websub = WebSubscription(url=url, hub=hub, topic=topic, secret=secret)
+        websub.hub, websub.topic, websub.secret, websub.requested_at = hub, topic, secret, datetime.utcnow()
+        session.add(websub)
+        await session.commit()
+        await session.refresh(websub)
+        return websub
+
+
+@observe_query
+async def update_websub(websub_id: int, **values: Any):
+    async with async_session() as session:
+        query = update(WebSubscription).where(WebSubscription.id == websub_id)  # type: ignore
+        await session.exec(query.values(**values))
+        await session.commit()
+
+
+class FeedUpdates:
+    """
+    Collect column updates of feed rows and newly seen entries during a poll cycle and write them
+    in a single transaction, so the database round-trips per cycle do not grow with the subscriptions.
+    """
+
+    def __init__(self):
+        self._rows: dict[int, dict[str, Any]] = {}
+        self._seen: list[dict[str, Any]] = []
+        self._entries: list[dict[str, Any]] = []
+        self._prune: dict[tuple[Any, str], int] = {}
+
+    def add(self, feed_id: int, **values: Any):
+        self._rows.setdefault(feed_id, {"feed_id": feed_id}).update(values)
+
+    def add_seen(self, url: str, entry_hashes: Sequence[int], retain: Optional[int] = None):
+        """
+        Remember entries of a feed, oldest first, and keep only the newest `retain` of them if given.
+        """
+        self._seen.extend({"url": url, "entry_hash": entry_hash} for entry_hash in entry_hashes)
+        if retain:
+            self._prune[(SeenEntry, url)] = retain
+
+    def add_entries(self, entries: Sequence[dict[str, Any]], url: str, retain: Optional[int] = None):
+        """
+        Add entries of a feed to the search index, oldest first, and keep only the newest `retain` if given.
+        """
+        self._entries.extend(entries)
+        if retain:
+            self._prune[(FeedEntry, url)] = retain
+
+    @observe_query
+    async def flush(self) -> int:
+        if not self._rows and not self._seen and not self._entries:
+            return 0
+        rows, self._rows = sorted(self._rows.values(), key=lambda row: sorted(row)), {}
+        seen, self._seen = self._seen, []
+        entries, self._entries = self._entries, []
+        prune, self._prune = self._prune, {}
+        async with async_session() as session:
+            # one executemany per set of columns, a core UPDATE skips rows deleted meanwhile,
+            # e.g. by an unsubscribe, where the ORM bulk UPDATE would fail the whole cycle
+            feeds = Feed.__table__  # type: ignore
+            for _, group in groupby(rows, key=lambda row: sorted(row)):
+                query = update(feeds).where(feeds.c.id == bindparam("feed_id"))
+                await session.exec(query, params=list(group))  # type: ignore
+            if seen:
+                await session.exec(insert(SeenEntry), params=seen)  # type: ignore
+            if entries:
+                await session.exec(insert(FeedEntry), params=entries)  # type: ignore
+            for (model, url), retain in prune.items():
+                keep = select(model.id).where(model.url == url).order_by(model.id.desc()).limit(retain)
+                await session.exec(delete(model).where(model.url == url, model.id.not_in(keep)))  # type: ignore
             await session.commit()
-            await session.refresh(feed)
-            return FeedResult(success=True, feed=feed)
+        return len(rows)
+
+
+ENTRY_FTS = table("feedentry_fts", column("rowid"), column("rank"), column("feedentry_fts"))
+_entry_fts: Optional[bool] = None  # whether the feedentry_fts table exists, checked by the first search
+
+
+async def has_entry_fts(session: Any) -> bool:
+    global _entry_fts
+    if _entry_fts is None:
+        _entry_fts = False
+        if database.engine and database.engine.dialect.name == "sqlite":
+            query = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feedentry_fts'")
+            _entry_fts = (await session.exec(query)).first() is not None
+    return _entry_fts
+
+
+@observe_query
+async def search_entries(channel_id: int, terms: str, limit: int) -> Sequence[FeedEntry]:
+    """
+    Entries of the channel's feeds containing every word of `terms`, best matches first on SQLite
+    with the full-text index, newest first with the LIKE fallback on other databases.
+    """
+    words = terms.split()
+    if not words:
+        return []
+    urls = select(Feed.url).where(Feed.channel_id == channel_id)
+    async with async_session() as session:
+        query = select(FeedEntry).where(FeedEntry.url.in_(urls))  # type: ignore
+        if await has_entry_fts(session):
+            # every word as a quoted string, so fts5 query syntax in the terms is matched literally
+            match = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+            query = query.join(ENTRY_FTS, ENTRY_FTS.c.rowid == FeedEntry.id)
+            query = query.where(ENTRY_FTS.c.feedentry_fts.op("MATCH")(match))
+            query = query.order_by(ENTRY_FTS.c.rank, FeedEntry.id.desc())  # type: ignore
         else:
-            return FeedResult(success=False, error=f"Feed with id {feed_id} not found")
+            for word in words:
+                title, summary = FeedEntry.title.icontains, FeedEntry.summary.icontains  # type: ignore
+                query = query.where(or_(title(word, autoescape=True), summary(word, autoescape=True)))
+            query = query.order_by(FeedEntry.id.desc())  # type: ignore
+        return (await session.exec(query.limit(limit))).all()
 
 
+@observe_query
 async def unsubscribe_feed(url: str, channel_id: int) -> FeedResult:
     async with async_session() as session:
         result = await session.exec(select(Feed).where(Feed.url == url, Feed.channel_id == channel_id))
         feed = result.one_or_none()
         if feed:
             await session.delete(feed)
+            # entries and the websub subscription are shared by all channels, drop them with the last subscription
+            result = await session.exec(select(Feed.id).where(Feed.url == url, Feed.id != feed.id).limit(1))
+            if not result.first():
+                await session.exec(delete(SeenEntry).where(SeenEntry.url == url))  # type: ignore
+                await session.exec(delete(FeedEntry).where(FeedEntry.url == url))  # type: ignore
+                await session.exec(delete(WebSubscription).where(WebSubscription.url == url))  # type: ignore
             await session.commit()
             return FeedResult(success=True, feed=feed)
         else:
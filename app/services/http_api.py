@@ -1,10 +1,26 @@
-from typing import Any
+import asyncio
+import re
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Mapping
 
 import aiohttp
-import feedparser  # type: ignore
 from attr import dataclass
 
 from app.config.settings import settings
+from app.services.metrics import (
+    BYTES_DOWNLOADED,
+    FEED_CACHE_HITS,
+    FETCH_RESPONSES,
+    FETCH_SECONDS,
+    PARSE_SECONDS,
+    log_slow_feed,
+)
 
 
 @dataclass
@@ -21,11 +37,177 @@ class JinrishiciSentenceResponse:
 class FetchFeedResponse:
     feed: Any = {}
     error: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    not_modified: bool = False  # 304, the feed is unchanged since the given validators
+    max_age: int | None = None  # seconds the response may be cached, from Cache-Control or Expires
+    hub: str | None = None  # websub hub and topic advertised by the feed
+    topic: str | None = None
+
+
+_SKIP_HOURS = re.compile(rb"<skipHours>(.*?)</skipHours>", re.IGNORECASE | re.DOTALL)
+_HOUR = re.compile(rb"<hour>\s*(\d{1,2})\s*</hour>", re.IGNORECASE)
+_ROOT = re.compile(rb"<(?![?!])([\w:.-]+)")
+_ENTRY_END = re.compile(rb"</(?:[\w.-]+:)?(?:item|entry)\s*>", re.IGNORECASE)
+
+
+def truncate_entries(data: bytes, limit: int) -> bytes:
+    """
+    Cut a feed document after its first `limit` items or entries and close the root element,
+    so feedparser does not spend time on the rest of a large archive.
+    """
+    end = None
+    for i, m in enumerate(_ENTRY_END.finditer(data), 1):
+        if i > limit:
+            break
+        end = m.end()
+    if end is None or i <= limit or not (root := _ROOT.search(data)):
+        return data
+    name = root.group(1)
+    closing = b"</channel></" + name + b">" if name.lower().endswith(b"rss") else b"</" + name + b">"
+    return data[:end] + closing
+
+
+def parse_feed(data: bytes, content_type: str | None = None) -> Any:
+    """
+    Parse a feed document, run in the parser pool. The bozo exception is replaced by its repr,
+    it may hold an open file and can not be sent back from a worker process.
+    """
+    import feedparser  # type: ignore  # imported by the first parse, not at startup
+
+    if settings.feed_max_entries:
+        data = truncate_entries(data, settings.feed_max_entries)
+    # feedparser detects the encoding from the raw bytes and the http charset
+    feed = feedparser.parse(data, response_headers={"content-type": content_type} if content_type else None)
+    if "bozo_exception" in feed:
+        feed["bozo_exception"] = repr(feed["bozo_exception"])
+    # feedparser flattens <skipHours>, pick the hours from the document itself
+    if m := _SKIP_HOURS.search(data):
+        feed["feed"]["skip_hours"] = sorted({int(h) for h in _HOUR.findall(m.group(1)) if int(h) < 24})
+    return feed
+
+
+def cache_lifetime(headers: Mapping[str, str]) -> int | None:
+    """
+    Seconds a response may be cached according to its Cache-Control or Expires header.
+    """
+    for directive in headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.strip('"').isdigit():
+            return int(value.strip('"'))
+    if expires := headers.get("Expires"):
+        try:
+            expires_at = parsedate_to_datetime(expires)
+            date = parsedate_to_datetime(headers["Date"]) if "Date" in headers else datetime.now(timezone.utc)
+            return max(int((expires_at - date).total_seconds()), 0)
+        except (TypeError, ValueError):  # malformed or naive dates
+            return None
+    return None
+
+
+def websub_links(feed: Any, links: Mapping[str, Mapping[str, Any]]) -> tuple[str | None, str | None]:
+    """
+    WebSub hub and topic urls of a feed, from the Link headers of the response or the links of the feed.
+    """
+    found = {rel: str(link["url"]) for rel, link in links.items() if rel in ("hub", "self")}
+    for link in feed.feed.get("links", []):
+        if link.get("rel") in ("hub", "self") and link.get("href"):
+            found.setdefault(link["rel"], link["href"])
+    return found.get("hub"), found.get("self")
+
+
+def create_parser_executor() -> Executor:
+    if settings.feed_parser_executor == "process":
+        return ProcessPoolExecutor(max_workers=settings.feed_parser_workers)
+    return ThreadPoolExecutor(max_workers=settings.feed_parser_workers, thread_name_prefix="feed-parser")
+
+
+class FetchLimiter:
+    """
+    Bound the number of in-flight requests, both globally and per host.
+    """
+
+    def __init__(self, limit: int, per_host_limit: int):
+        self._global = asyncio.Semaphore(limit)
+        self._per_host_limit = per_host_limit
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def acquire(self, url: str):
+        host = urllib.parse.urlsplit(url).hostname or ""
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self._per_host_limit)
+        # take the host slot first so a busy host does not hold global slots while waiting
+        async with self._hosts[host], self._global:
+            yield
+
+
+def create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.http_connection_limit,
+        limit_per_host=settings.http_connection_limit_per_host,
+        ttl_dns_cache=settings.http_dns_cache_ttl,
+        keepalive_timeout=settings.http_keepalive_timeout,
+    )
+    # a dead host fails after the connect timeout, a stalled one after the read timeout,
+    # and one trickling a few bytes at a time after the total timeout, which includes reading the body
+    timeout = aiohttp.ClientTimeout(
+        total=settings.http_total_timeout, connect=settings.http_connect_timeout, sock_read=settings.http_read_timeout
+    )
+    # aiohttp sends Accept-Encoding: gzip, deflate, br by itself since brotli is installed
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
 
 
 class HTTPService:
-    _conn = aiohttp.TCPConnector()
-    session = aiohttp.ClientSession(connector=_conn, timeout=aiohttp.ClientTimeout(total=10))
+    """
+    HTTP client of the bot, start() and close() it with the event loop that uses it.
+    """
+
+    def __init__(self):
+        self._session: aiohttp.ClientSession | None = None
+        self._parser_executor: Executor | None = None
+        self._feed_cache: OrderedDict[str, tuple[float, FetchFeedResponse]] = OrderedDict()
+        self._inflight: dict[tuple[str, str | None, str | None], asyncio.Task[FetchFeedResponse]] = {}
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = create_session()
+
+    async def close(self):
+        self._feed_cache.clear()
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._parser_executor:
+            self._parser_executor.shutdown(wait=False, cancel_futures=True)
+            self._parser_executor = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("HTTPService is not started")
+        return self._session
+
+    async def parse_feed(self, data: bytes, content_type: str | None = None) -> Any:
+        # parsing a large feed takes long enough to stall the event loop, keep it in the pool
+        if self._parser_executor is None:
+            self._parser_executor = create_parser_executor()
+        loop = asyncio.get_running_loop()
+        with PARSE_SECONDS.time():
+            return await loop.run_in_executor(self._parser_executor, parse_feed, data, content_type)
+
+    async def read_body(self, resp: aiohttp.ClientResponse) -> bytes | None:
+        """
+        Read the raw body in chunks, or return None as soon as it grows over the size limit.
+        """
+        if resp.content_length and resp.content_length > settings.feed_max_body_size:
+            return None
+        body = bytearray()
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            body.extend(chunk)
+            if len(body) > settings.feed_max_body_size:
+                return None
+        return bytes(body)
 
     async def jinrishici_sentence(self):
         headers = {
@@ -77,15 +259,99 @@ class HTTPService:
         except Exception as e:
             return JinrishiciSentenceResponse(error=repr(e))
 
-    async def fetch_feed(self, url: str) -> FetchFeedResponse:
+    async def fetch_feed(
+        self, url: str, etag: str | None = None, last_modified: str | None = None
+    ) -> FetchFeedResponse:
+        """
+        Fetch and parse a feed. Full responses are cached for a short while, and concurrent calls with the same
+        arguments share one fetch, so testing, subscribing and polling a feed within seconds downloads it once.
+        The cached responses are shared, callers must not modify them.
+        """
+        if cached := self._cached_feed(url):
+            FEED_CACHE_HITS.inc()
+            if (etag == cached.etag) if etag else (last_modified and last_modified == cached.last_modified):
+                return FetchFeedResponse(
+                    etag=cached.etag, last_modified=cached.last_modified, not_modified=True, max_age=cached.max_age
+                )
+            return cached
+
+        key = (url, etag, last_modified)
+        if key not in self._inflight:
+            self._inflight[key] = task = asyncio.create_task(self._fetch_feed(url, etag, last_modified))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # a cancelled caller must not cancel the fetch the other callers wait for
+        return await asyncio.shield(self._inflight[key])
+
+    def _cached_feed(self, url: str) -> FetchFeedResponse | None:
+        if cached := self._feed_cache.get(url):
+            expires_at, feed = cached
+            if expires_at > time.monotonic():
+                self._feed_cache.move_to_end(url)
+                return feed
+            del self._feed_cache[url]
+        return None
+
+    async def _fetch_feed(self, url: str, etag: str | None, last_modified: str | None) -> FetchFeedResponse:
+        feed = await self.request_feed(url, etag, last_modified)
+        if settings.feed_cache_ttl and not feed.error and not feed.not_modified:
+            self._feed_cache[url] = (time.monotonic() + settings.feed_cache_ttl, feed)
+            self._feed_cache.move_to_end(url)
+            if len(self._feed_cache) > settings.feed_cache_size:
+                self._feed_cache.popitem(last=False)
+        return feed
+
+    async def request_feed(
+        self, url: str, etag: str | None = None, last_modified: str | None = None
+    ) -> FetchFeedResponse:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
         try:
-            async with self.session.get(url) as resp:
-                if resp.status == 200:
-                    text = await resp.text()
-                    feed = feedparser.parse(text)
-                    if feed and feed.get("version"):
-                        return FetchFeedResponse(feed=feed)
-                    return FetchFeedResponse(error="Not a valid feed")
-                return FetchFeedResponse(error=f"HTTP {resp.status} {resp.reason}")
+            with FETCH_SECONDS.time(), log_slow_feed("fetch", url):
+                async with self.session.get(url, headers=headers) as resp:
+                    FETCH_RESPONSES.inc(status=resp.status)
+                    if resp.status == 304:
+                        # the body is empty, nothing to read or parse
+                        return FetchFeedResponse(
+                            etag=resp.headers.get("ETag", etag),
+                            last_modified=resp.headers.get("Last-Modified", last_modified),
+                            not_modified=True,
+                            max_age=cache_lifetime(resp.headers),
+                        )
+                    if resp.status != 200:
+                        return FetchFeedResponse(error=f"HTTP {resp.status} {resp.reason}")
+                    body = await self.read_body(resp)
+                    if body is None:
+                        return FetchFeedResponse(error=f"Feed is larger than {settings.feed_max_body_size} bytes")
+            # the connection is back in the pool while the body is parsed
+            BYTES_DOWNLOADED.inc(len(body))
+            with log_slow_feed("parse", url):
+                feed = await self.parse_feed(body, resp.headers.get("Content-Type"))
+            if feed and feed.get("version"):
+                hub, topic = websub_links(feed, resp.links)
+                return FetchFeedResponse(
+                    feed=feed,
+                    etag=resp.headers.get("ETag"),
+                    last_modified=resp.headers.get("Last-Modified"),
+                    max_age=cache_lifetime(resp.headers),
+                    hub=hub,
+                    topic=topic,
+                )
+            return FetchFeedResponse(error="Not a valid feed")
         except Exception as e:
+            FETCH_RESPONSES.inc(status=type(e).__name__)
             return FetchFeedResponse(error=repr(e))
+
+    async def request_websub(self, hub: str, form: dict[str, str]) -> str | None:
+        """
+        Send a subscription request to a websub hub, return the error if the hub did not accept it.
+        """
+        try:
+            async with self.session.post(hub, data=form) as resp:
+                if 200 <= resp.status < 300:  # 202 accepted, verified by a callback later
+                    return None
+                return f"HTTP {resp.status} {resp.reason}: {(await resp.text())[:200]}"
+        except Exception as e:
+            return repr(e)
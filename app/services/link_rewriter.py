@@ -0,0 +1,97 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from app.config.settings import settings
+
+NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+
+
+def domain_pattern(domains: tuple[str, ...]) -> str:
+    # longest first, so a domain is not cut short by another that is a prefix of it
+    return "|".join(re.escape(domain) for domain in sorted(domains, key=len, reverse=True))
+
+
+@dataclass
+class LinkRule:
+    """
+    Rewrite links of some domains to another host, e.g. to a site with better discord embeds.
+    `path` is a regex fragment the link path must match, its named groups are available to `template`.
+    """
+
+    domains: tuple[str, ...]
+    target: str
+    path: str = r"/[^\s<>|)\]]*"
+    template: str = ":link: [{domain}]({url})"
+    pattern: re.Pattern = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.pattern = re.compile(
+            rf"https?://(?:www\.|mobile\.)?(?P<domain>{domain_pattern(self.domains)})(?P<path>{self.path})"
+        )
+
+    def regex(self) -> str:
+        """
+        The rule's regex without named groups, they would clash when rules are combined in one pattern.
+        """
+        return rf"https?://(?:www\.|mobile\.)?(?:{domain_pattern(self.domains)}){NAMED_GROUP.sub('(?:', self.path)}"
+
+    def format(self, link: str) -> tuple[str, str]:
+        """
+        The rewritten url and the message line for a link matched by this rule.
+        """
+        match = self.pattern.match(link)
+        assert match
+        url = f"https://{self.target}{match['path']}"
+        return url, self.template.format(url=url, **match.groupdict())
+
+
+TWITTER = LinkRule(
+    domains=("twitter.com", "x.com"),
+    target="fxtwitter.com",
+    path=r"/(?P<user>\w+)/status/\d+",
+    template=":bird: [Tweet • {user}]({url})",
+)
+
+
+def configured_rules() -> list[LinkRule]:
+    rules = [TWITTER] if settings.enable_fxtwitter else []
+    rules.extend(LinkRule(domains=(domain,), target=target) for domain, target in settings.link_rewrites.items())
+    return rules
+
+
+class LinkRewriter:
+    """
+    Rewrite the links of a message with all rules at once: one combined regex finds the links of every rule,
+    and messages without "://" are skipped without running it. Links rewritten in a channel recently
+    are not rewritten again there, so a link pasted repeatedly in a busy channel is only answered once.
+    """
+
+    def __init__(self, rules: list[LinkRule]):
+        self.rules = rules
+        # rule i matches as group r{i}, lastgroup tells which rule a match belongs to
+        alternatives = "|".join(rf"(?P<r{i}>{rule.regex()})" for i, rule in enumerate(rules))
+        self._pattern = re.compile(alternatives) if rules else None
+        self._recent: OrderedDict[tuple[int, str], float] = OrderedDict()
+
+    def rewrite(self, channel_id: int, text: str) -> list[str]:
+        """
+        Message lines for the links in text that were not rewritten in the channel recently.
+        """
+        if not self._pattern or "://" not in text:
+            return []
+        lines = []
+        now = time.monotonic()
+        for match in self._pattern.finditer(text):
+            assert match.lastgroup
+            url, line = self.rules[int(match.lastgroup[1:])].format(match[0])
+            key = (channel_id, url)
+            if (expires_at := self._recent.get(key)) and expires_at > now:
+                continue
+            self._recent[key] = now + settings.link_rewrite_ttl
+            self._recent.move_to_end(key)
+            if len(self._recent) > settings.link_rewrite_cache_size:
+                self._recent.popitem(last=False)
+            lines.append(line)
+        return lines
@@ -0,0 +1,180 @@
+import functools
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from aiohttp import web
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+REGISTRY: list["Metric"] = []
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        REGISTRY.append(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.values: dict[tuple[tuple[str, str], ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: Any):
+        self.values[tuple(sorted((k, str(v)) for k, v in labels.items()))] += amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{format_labels(labels)} {value}" for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any):
+        self.values[tuple(sorted((k, str(v)) for k, v in labels.items()))] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        self.counts: dict[tuple[tuple[str, str], ...], list[int]] = {}
+        self.sums: dict[tuple[tuple[str, str], ...], float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        if key not in self.counts:
+            self.counts[key] = [0] * (len(self.buckets) + 1)
+        counts = self.counts[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += 1  # +Inf
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: Any):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for labels, counts in self.counts.items():
+            for bound, count in zip([*map(str, self.buckets), "+Inf"], counts):
+                lines.append(f"{self.name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+POLL_CYCLE_SECONDS = Histogram("dominus_poll_cycle_seconds", "Duration of a feed poll cycle.")
+FEEDS_POLLED = Counter("dominus_feeds_polled_total", "Feed urls polled.")
+LAST_CYCLE_FEEDS = Gauge("dominus_poll_cycle_feeds", "Feed urls polled in the last cycle.")
+FETCH_RESPONSES = Counter("dominus_feed_fetch_responses_total", "Feed fetches by HTTP status or error.")
+FETCH_SECONDS = Histogram("dominus_feed_fetch_seconds", "Feed fetch latency, including the body download.")
+PARSE_SECONDS = Histogram("dominus_feed_parse_seconds", "Feed parse time, including the wait for a worker.")
+BYTES_DOWNLOADED = Counter("dominus_feed_downloaded_bytes_total", "Bytes of feed bodies downloaded.")
+FEED_CACHE_HITS = Counter("dominus_feed_cache_hits_total", "Feed fetches answered from the fetch cache.")
+WEBSUB_PUSHES = Counter("dominus_websub_pushes_total", "Feed updates pushed by websub hubs, by result.")
+DB_QUERY_SECONDS = Histogram("dominus_db_query_seconds", "Duration of database helpers.")
+DISCORD_SEND_SECONDS = Histogram("dominus_discord_send_seconds", "Discord message send latency.")
+DISCORD_SEND_ERRORS = Counter("dominus_discord_send_errors_total", "Failed discord message sends.")
+DISCORD_RATE_LIMITED = Counter("dominus_discord_rate_limited_total", "Discord 429 responses.")
+
+
+@contextmanager
+def log_slow_feed(action: str, url: str):
+    """
+    Log the url of a feed whose fetch or parse is slower than the threshold. The histograms have no url label,
+    it would add a series for every feed ever polled.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if (seconds := time.perf_counter() - start) > settings.metrics_slow_feed_seconds:
+            logger.warning(f"slow feed {action}, {seconds:.1f}s: {url}")
+
+
+def observe_query(func: Callable) -> Callable:
+    """
+    Record the duration of an async database helper, labelled with its name.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with DB_QUERY_SECONDS.time(query=func.__qualname__):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    nextcord retries 429 responses by itself and only logs them, count those log records.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        if str(record.msg).startswith("We are being rate limited"):
+            DISCORD_RATE_LIMITED.inc()
+
+
+def render() -> str:
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        text=render(), content_type="text/plain", charset="utf-8", headers={"Cache-Control": "no-cache"}
+    )
+
+
+async def start_metrics_server() -> web.AppRunner | None:
+    """
+    Serve the metrics in the Prometheus text format, if a metrics port is set.
+    A port that can not be bound is logged, polling goes on without metrics.
+    """
+    if not settings.metrics_port:
+        return None
+    logging.getLogger("nextcord.http").addHandler(RateLimitLogHandler())
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, settings.metrics_host, settings.metrics_port).start()
+    except OSError as e:  # e.g. the port is in use
+        logger.error(f"metrics server not started on {settings.metrics_host}:{settings.metrics_port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"metrics served at http://{settings.metrics_host}:{settings.metrics_port}/metrics")
+    return runner
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from collections import deque
+
+from app.config.settings import settings
+from app.services.http_api import HTTPService, JinrishiciSentenceResponse
+
+logger = logging.getLogger(__name__)
+
+
+class PoemPool:
+    """
+    Buffer of prefetched poems, so the poem command answers from memory. Once the buffer is down to the
+    low-water mark it is refilled in the background, one api call per refill interval.
+    """
+
+    def __init__(self, http_service: HTTPService):
+        self.http_service = http_service
+        self._poems: deque[JinrishiciSentenceResponse] = deque()
+        self._refill: asyncio.Task | None = None
+
+    def refill(self):
+        if len(self._poems) <= settings.poem_pool_low_water and (self._refill is None or self._refill.done()):
+            self._refill = asyncio.create_task(self._fill())
+
+    async def get(self) -> JinrishiciSentenceResponse:
+        poem = self._poems.popleft() if self._poems else None
+        self.refill()
+        # the buffer may have run dry, e.g. right after startup or while the api fails
+        return poem or await self.http_service.jinrishici_sentence()
+
+    async def _fill(self):
+        while len(self._poems) < settings.poem_pool_size:
+            poem = await self.http_service.jinrishici_sentence()
+            if poem.error:
+                # stop here, the next command starts over
+                logger.warning(f"failed to prefetch a poem: {poem.error}")
+                return
+            self._poems.append(poem)
+            await asyncio.sleep(settings.poem_pool_refill_interval)
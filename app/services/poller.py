@@ -0,0 +1,363 @@
+import asyncio
+import contextlib
+import hashlib
+import html
+import logging
+import os
+import re
+import signal
+import time
+import traceback
+from calendar import timegm
+from collections import defaultdict
+from datetime import datetime, timedelta
+from time import mktime
+from typing import TYPE_CHECKING, Any
+
+import nextcord
+
+from app.config.settings import settings
+from app.database import close_database, start_database
+from app.models.feed import Feed, WebSubscription
+from app.services.channels import ChannelResolver
+from app.services.delivery import DeliveryQueue
+from app.services.feed import (
+    FeedUpdates,
+    get_next_poll_at,
+    get_seen_entries,
+    get_websubs,
+    lease_due_feeds,
+    renew_leases,
+)
+from app.services.http_api import FetchLimiter, HTTPService
+from app.services.metrics import FEEDS_POLLED, LAST_CYCLE_FEEDS, POLL_CYCLE_SECONDS, start_metrics_server
+from app.services.scheduler import next_poll_at, next_poll_interval, retry_interval
+
+if TYPE_CHECKING:
+    from app.services.websub import WebSubscriber
+
+logger = logging.getLogger(__name__)
+
+MAX_ERROR_LENGTH = 500  # characters of the last fetch error kept on a feed
+TAG = re.compile(r"<[^>]*>")
+
+
+class FeedPoller:
+    """
+    Poll the due feeds concurrently, bounded by a global and a per-host limit.
+    Each url is fetched once and the result is fanned out to every subscribed channel.
+    Every feed has its own due time, the feed table ordered by next_poll_at is the schedule queue.
+    Due feeds are leased before polling, so any number of pollers can share the feed table.
+    Feeds whose websub hub pushes them are polled less often, see WebSubscriber.
+    """
+
+    def __init__(self, client: nextcord.Client, http_service: HTTPService):
+        self.client = client
+        self.http_service = http_service
+        self.channels = ChannelResolver(client)
+        self.delivery = DeliveryQueue()
+        self.limiter = FetchLimiter(settings.feed_fetch_concurrency, settings.feed_fetch_per_host_concurrency)
+        self._wakeup = asyncio.Event()
+        self._profile_waiters: list[asyncio.Future[str]] = []
+        self.websub: "WebSubscriber | None" = None
+        if settings.websub_callback_url:  # imported only when enabled
+            from app.services.websub import WebSubscriber
+
+            self.websub = WebSubscriber(self)
+
+    async def run(self):
+        await start_metrics_server()
+        try:
+            # kill -USR1 profiles the next cycle and writes the report to a file
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.profile_to_file)
+        except (NotImplementedError, RuntimeError):  # no signals on windows or outside the main thread
+            pass
+        if self.websub:
+            try:
+                await self.websub.start()
+            except OSError as e:  # e.g. the port is in use, poll without push delivery then
+                logger.error(f"websub callback server not started: {e}")
+                await self.websub.close()
+                self.websub = None
+        try:
+            await self.poll_forever()
+        finally:
+            if self.websub:
+                await self.websub.close()
+
+    async def poll_forever(self):
+        while not self.client.is_closed():
+            delay = settings.feed_poll_min_interval
+            waiters, self._profile_waiters = self._profile_waiters, []
+            profile = None
+            if waiters:
+                from app.services.profiler import CycleProfile
+
+                profile = CycleProfile()
+            try:
+                with profile or contextlib.nullcontext():
+                    delay = await self.poll()
+            except Exception as e:  # handle all exceptions here to avoid task hang
+                info = await self.client.application_info()
+                channel = await self.client.create_dm(info.owner)
+                await channel.send(f"```feed task error: {traceback.format_exc()}```")
+                logger.error(f"feed task error: {e}", exc_info=True)
+            if profile:
+                report = profile.report(settings.profile_top)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(report)
+            logger.info(f"feed task finished, sleep {delay:.0f}s")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def profile_next_cycle(self) -> asyncio.Future[str]:
+        """
+        Run the next poll cycle right away under the profiler, the future resolves to the report.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._profile_waiters.append(waiter)
+        self._wakeup.set()
+        return waiter
+
+    def profile_to_file(self):
+        def write(waiter: asyncio.Future[str]):
+            path = os.path.join(
+                settings.profile_dir, f"dominus_profile_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.txt"
+            )
+            with open(path, "w") as f:
+                f.write(waiter.result())
+            logger.info(f"poll cycle profile written to {path}")
+
+        logger.info("profiling the next poll cycle")
+        self.profile_next_cycle().add_done_callback(write)
+
+    async def poll(self) -> float:
+        """
+        Poll the feeds that are due and return the seconds until the next one is.
+        """
+        start, now = time.perf_counter(), datetime.utcnow()
+        leased = await lease_due_feeds(
+            settings.worker_id, now, now + timedelta(seconds=settings.feed_lease_ttl), settings.feed_lease_batch
+        )
+
+        # group subscriptions by url, so a feed subscribed in many channels is fetched only once
+        subscriptions: dict[str, list[tuple[Any, Feed]]] = defaultdict(list)
+        channels: dict[int, Any] = {}
+        for _feed in leased:
+            if _feed.channel_id not in channels:
+                channels[_feed.channel_id] = await self.channels.resolve(_feed.channel_id)
+            subscriptions[_feed.url].append((channels[_feed.channel_id], _feed))
+
+        # one failed feed must not cancel the others, raise the first error once all are done
+        updates = FeedUpdates()
+        seen = await get_seen_entries(list(subscriptions))
+        websubs = await get_websubs(list(subscriptions)) if self.websub and subscriptions else {}
+        renewal = asyncio.create_task(self.keep_leased([_feed.id for _feed in leased if _feed.id]))
+        try:
+            results = await asyncio.gather(
+                *(
+                    self.check_feed(url, subs, seen[url], updates, websubs.get(url))
+                    for url, subs in subscriptions.items()
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            renewal.cancel()
+            await asyncio.gather(renewal, return_exceptions=True)
+            logger.info(f"updated {await updates.flush()} feeds")
+            if subscriptions:
+                POLL_CYCLE_SECONDS.observe(time.perf_counter() - start)
+                FEEDS_POLLED.inc(len(subscriptions))
+            LAST_CYCLE_FEEDS.set(len(subscriptions))
+        if errors := [r for r in results if isinstance(r, BaseException)]:
+            raise errors[0]
+
+        # wake up at least every min interval to pick up new subscriptions
+        delay = settings.feed_poll_min_interval
+        if due := await get_next_poll_at(datetime.utcnow()):
+            delay = min(max((due - datetime.utcnow()).total_seconds(), 1), delay)
+        return delay
+
+    async def keep_leased(self, feed_ids: list[int]):
+        """
+        Renew the leases of a cycle's feeds while it runs, so a cycle longer than the lease TTL,
+        e.g. many feeds of one host behind the per-host limit, does not lose its feeds to another worker.
+        """
+        if not feed_ids:
+            return
+        while True:
+            await asyncio.sleep(settings.feed_lease_ttl / 3)
+            now = datetime.utcnow()
+            try:
+                await renew_leases(settings.worker_id, feed_ids, now, now + timedelta(seconds=settings.feed_lease_ttl))
+            except Exception as e:  # try again on the next round, the lease is still valid for a while
+                logger.error(f"lease renewal error: {e}", exc_info=True)
+
+    async def check_feed(
+        self,
+        url: str,
+        subscriptions: list[tuple[Any, Feed]],
+        seen: set[int],
+        updates: FeedUpdates,
+        websub: WebSubscription | None = None,
+    ):
+        def schedule(interval: int, skip_hours: list[int] | None = None):
+            due = next_poll_at(datetime.utcnow(), interval, skip_hours)
+            for _, _feed in subscriptions:
+                updates.add(_feed.id, next_poll_at=due, poll_interval=interval, lease_owner=None, lease_expires_at=None)
+
+        if not any(channel for channel, _ in subscriptions):
+            # no channel to post to, keep the feed in the queue without fetching it
+            schedule(subscriptions[0][1].poll_interval)
+            return
+
+        # only send validators every subscription agrees on, a new subscription always gets a full response
+        validators = {(_feed.etag, _feed.last_modified) for _, _feed in subscriptions}
+        etag, last_modified = next(iter(validators)) if len(validators) == 1 else (None, None)
+        async with self.limiter.acquire(url):
+            feed = await self.http_service.fetch_feed(url, etag=etag, last_modified=last_modified)
+
+        if feed.error:
+            self.failed(url, subscriptions, feed.error, updates)
+            return
+        self.recovered(url, subscriptions, updates)
+
+        interval = next_poll_interval(feed, subscriptions[0][1].poll_interval)
+        if self.websub and self.websub.pushes(url, feed, websub):
+            # the hub pushes new entries, polling only catches lost pushes
+            interval = max(interval, settings.websub_poll_interval)
+        schedule(interval, None if feed.not_modified else feed.feed.feed.get("skip_hours"))
+        logger.info(f"next poll of {url} in {interval}s")
+
+        if feed.not_modified:
+            logger.info(f"feed not modified: {url}")
+            return
+        if len(validators) > 1 or (feed.etag, feed.last_modified) != (etag, last_modified):
+            for _, _feed in subscriptions:
+                updates.add(_feed.id, etag=feed.etag, last_modified=feed.last_modified)
+
+        self.post_new_entries(url, subscriptions, seen, feed.feed, updates)
+
+    def post_new_entries(
+        self, url: str, subscriptions: list[tuple[Any, Feed]], seen: set[int], parsed: Any, updates: FeedUpdates
+    ):
+        """
+        Post the entries of a polled or pushed feed that were not seen before, and index them.
+        """
+        entries = {entry_hash(entry): entry for entry in parsed.entries}
+        if not entries:
+            return
+        # oldest first, feeds without dates are assumed to list the newest entry first
+        unseen_hashes = sorted(reversed([h for h in entries if h not in seen]), key=lambda h: published_at(entries[h]))
+        unseen = [entries[h] for h in unseen_hashes]
+        # pruning keeps the last inserted hashes, so they are inserted oldest first too,
+        # and entries still in the feed are never forgotten, they would be posted again
+        retain = max(settings.feed_seen_entries_retention, len(entries))
+        updates.add_seen(url, unseen_hashes, retain if len(seen) + len(unseen_hashes) > retain else None)
+        if unseen and (keep := settings.feed_entry_index_retention):
+            rows = [entry_row(url, entry) for entry in unseen[-keep:]]
+            # every entry is indexed when it is first seen, so the index has no more rows than there are seen
+            # hashes, unless the hashes were pruned already
+            indexed = min(len(seen), keep) if len(seen) < settings.feed_seen_entries_retention else keep
+            updates.add_entries(rows, url, keep if indexed + len(rows) > keep else None)
+
+        if not seen:
+            # first poll of the url, fall back to posting the newest entry if it is newer than last_checked
+            entry = parsed.entries[0]
+            dt = entry.get("published_parsed") or entry.get("updated_parsed")  # rss, aotm
+            published = datetime.fromtimestamp(mktime(dt)) if dt else datetime.utcnow()
+            new = {_feed.id: [entry] for _, _feed in subscriptions if published > _feed.last_checked}
+        else:
+            new = {_feed.id: unseen[-settings.feed_max_new_entries :] for _, _feed in subscriptions if unseen}
+
+        for channel, _feed in subscriptions:
+            if channel and (posts := new.get(_feed.id)):
+                logger.info(f"{len(posts)} new entries found in: {url}, channel: {_feed.channel_id}")
+                for entry in posts:
+                    self.delivery.send(channel, f":newspaper2: New feed from **{_feed.title}**!\n{entry.link}")
+                updates.add(_feed.id, last_checked=datetime.utcnow())
+
+    def failed(self, url: str, subscriptions: list[tuple[Any, Feed]], error: str, updates: FeedUpdates):
+        """
+        Back off a failing feed, and tell its channels once when it is failing too often to be polled normally.
+        """
+        failures = max(_feed.consecutive_failures for _, _feed in subscriptions) + 1
+        interval = retry_interval(failures)
+        due = next_poll_at(datetime.utcnow(), interval)
+        logger.error(f"feed {url} failed {failures} times in a row, retry in {interval}s: {error}")
+        for channel, _feed in subscriptions:
+            updates.add(
+                _feed.id,
+                next_poll_at=due,
+                consecutive_failures=failures,
+                last_error=error[:MAX_ERROR_LENGTH],
+                lease_owner=None,
+                lease_expires_at=None,
+            )
+            if channel and _feed.consecutive_failures < settings.feed_failure_threshold <= failures:
+                self.delivery.send(
+                    channel,
+                    f":warning: Feed **{_feed.title}** failed {failures} times in a row and is paused until it works "
+                    f"again, next retry <t:{timegm(due.timetuple())}:R>.\n{url}: {error}",
+                )
+
+    def recovered(self, url: str, subscriptions: list[tuple[Any, Feed]], updates: FeedUpdates):
+        for channel, _feed in subscriptions:
+            if not _feed.consecutive_failures:
+                continue
+            updates.add(_feed.id, consecutive_failures=0, last_error=None)
+            if channel and _feed.consecutive_failures >= settings.feed_failure_threshold:
+                logger.info(f"feed {url} recovered after {_feed.consecutive_failures} failures")
+                self.delivery.send(channel, f":white_check_mark: Feed **{_feed.title}** is back.\n{url}")
+
+
+def entry_hash(entry: Any) -> int:
+    """
+    Compact 64-bit key of an entry, from its guid or link.
+    """
+    key = entry.get("id") or entry.get("link") or entry.get("title", "")
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def published_at(entry: Any) -> int:
+    dt = entry.get("published_parsed") or entry.get("updated_parsed")
+    return timegm(dt) if dt else 0
+
+
+def entry_row(url: str, entry: Any) -> dict[str, Any]:
+    """
+    Search index row of an entry, with the summary as plain text.
+    """
+    summary = html.unescape(TAG.sub(" ", entry.get("summary", "")))
+    timestamp = published_at(entry)
+    return {
+        "url": url,
+        "title": entry.get("title", ""),
+        "link": entry.get("link", ""),
+        "summary": " ".join(summary.split())[: settings.feed_entry_summary_length],
+        "published": datetime.utcfromtimestamp(timestamp) if timestamp else None,
+    }
+
+
+def start_worker():
+    """
+    Run a poller without the gateway connection, it only needs the REST api to post notifications.
+    """
+
+    async def runner():
+        client = nextcord.Client(intents=nextcord.Intents.none())
+        http_service = HTTPService()
+        started_at = time.perf_counter()
+        await asyncio.gather(client.login(settings.discord_bot_token), http_service.start(), start_database())
+        logger.info(f"feed poller worker {settings.worker_id} started in {time.perf_counter() - started_at:.3f}s")
+        try:
+            await FeedPoller(client, http_service).run()
+        finally:
+            await asyncio.gather(http_service.close(), close_database())
+            await client.close()
+
+    asyncio.run(runner())
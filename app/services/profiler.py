@@ -0,0 +1,48 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+
+class CycleProfile:
+    """
+    Profile the code between enter and exit with cProfile and trace its memory allocations with tracemalloc.
+    Every task of the event loop thread is profiled, parser workers in other threads or processes are not.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.seconds = 0.0
+
+    def __enter__(self) -> "CycleProfile":
+        # leave tracemalloc running if someone else started it
+        self._tracing = tracemalloc.is_tracing()
+        if not self._tracing:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self._start
+        self.snapshot = tracemalloc.take_snapshot()
+        if not self._tracing:
+            tracemalloc.stop()
+
+    def report(self, top: int) -> str:
+        """
+        The top functions by cumulative time and the top allocation sites, as text.
+        """
+        out = io.StringIO()
+        out.write(f"poll cycle took {self.seconds:.3f}s\n\n")
+        pstats.Stats(self.profile, stream=out).strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+        out.write(f"top {top} allocation sites still alive at the end of the cycle\n")
+        assert self.snapshot
+        stats = self.snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+        for stat in stats[:top]:
+            out.write(f"{stat}\n")
+        return out.getvalue()
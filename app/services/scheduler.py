@@ -0,0 +1,70 @@
+import random
+from calendar import timegm
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.config.settings import settings
+from app.services.http_api import FetchFeedResponse
+
+OBSERVED_ENTRIES = 10  # newest entries used to estimate how often a feed is updated
+UNCHANGED_BACKOFF = 1.5  # grow the interval while a feed keeps answering 304
+JITTER = 0.1  # spread feeds that share an interval over time instead of polling them in one burst
+
+
+def observed_interval(entries: list[Any]) -> float | None:
+    """
+    Average gap in seconds between the newest entries, or None if there are not enough dated entries.
+    """
+    timestamps = sorted(
+        (timegm(dt) for entry in entries if (dt := entry.get("published_parsed") or entry.get("updated_parsed"))),
+        reverse=True,
+    )[:OBSERVED_ENTRIES]
+    if len(timestamps) < 2:
+        return None
+    return (timestamps[0] - timestamps[-1]) / (len(timestamps) - 1)
+
+
+def next_poll_interval(feed: FetchFeedResponse, previous: int) -> int:
+    """
+    Seconds until a fetched feed should be polled again, based on how often it is updated,
+    its RSS <ttl> and the HTTP cache lifetime, within the configured bounds.
+    """
+    if feed.not_modified:
+        interval = previous * UNCHANGED_BACKOFF
+    elif gap := observed_interval(feed.feed.entries):
+        interval = gap / 2  # poll twice per expected update
+    else:
+        interval = float(settings.feed_poll_max_interval)
+
+    if not feed.not_modified:
+        ttl = feed.feed.feed.get("ttl", "")
+        if ttl.isdigit():  # minutes the feed may be cached
+            interval = max(interval, int(ttl) * 60)
+    if feed.max_age is not None:
+        interval = max(interval, feed.max_age)
+
+    interval *= random.uniform(1 - JITTER, 1 + JITTER)
+    return int(min(max(interval, settings.feed_poll_min_interval), settings.feed_poll_max_interval))
+
+
+def retry_interval(failures: int) -> int:
+    """
+    Seconds until a failing feed is retried, doubling with every failure in a row up to the max interval.
+    Beyond the failure threshold the circuit is open and the feed is only retried once per open interval.
+    """
+    if failures >= settings.feed_failure_threshold:
+        interval = float(settings.feed_circuit_open_interval)
+    else:
+        interval = min(settings.feed_poll_min_interval * 2 ** (failures - 1), settings.feed_poll_max_interval)
+    return int(interval * random.uniform(1 - JITTER, 1 + JITTER))
+
+
+def next_poll_at(now: datetime, interval: int, skip_hours: list[int] | None = None) -> datetime:
+    """
+    Due time of the next poll, moved to the start of the next allowed hour if it falls into an RSS <skipHours> hour.
+    """
+    due = now + timedelta(seconds=interval)
+    if skip_hours and len(set(skip_hours)) < 24:
+        while due.hour in skip_hours:
+            due = due.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return due
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Coroutine
+
+from aiohttp import web
+
+from app.config.settings import settings
+from app.models.feed import WebSubscription
+from app.services.feed import (
+    FeedUpdates,
+    get_seen_entries,
+    get_websub,
+    get_websubs_to_renew,
+    lease_url,
+    save_websub,
+    update_websub,
+)
+from app.services.http_api import FetchFeedResponse
+from app.services.metrics import WEBSUB_PUSHES
+
+if TYPE_CHECKING:
+    from app.services.poller import FeedPoller
+
+logger = logging.getLogger(__name__)
+
+RENEW_CHECK_INTERVAL = 60 * 10  # seconds between looking for subscriptions to renew
+
+
+def signature_matches(secret: str, signature: str | None, body: bytes) -> bool:
+    """
+    Check the X-Hub-Signature header of a push, "method=hexdigest" of the HMAC of the body keyed with the secret.
+    """
+    method, _, digest = (signature or "").partition("=")
+    if method not in ("sha1", "sha256", "sha384", "sha512"):
+        return False
+    return hmac.compare_digest(hmac.new(secret.encode(), body, getattr(hashlib, method)).hexdigest(), digest)
+
+
+class WebSubscriber:
+    """
+    Subscribe to the websub hubs advertised by polled feeds, and post the content they push like polled content.
+    Pushed feeds are still polled every websub poll interval, a hub may lose a push or drop the subscription.
+    """
+
+    def __init__(self, poller: "FeedPoller"):
+        self.poller = poller
+        self._runner: web.AppRunner | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._subscribing: set[str] = set()
+
+    async def start(self):
+        # pushes carry the whole feed, so they get the same size limit as fetched feeds
+        app = web.Application(client_max_size=settings.feed_max_body_size)
+        app.router.add_get("/websub/{id:\\d+}", self.verify)
+        app.router.add_post("/websub/{id:\\d+}", self.receive)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, settings.websub_host, settings.websub_port).start()
+        self.spawn(self.renew())
+        logger.info(
+            f"websub callbacks served at http://{settings.websub_host}:{settings.websub_port}/websub, "
+            f"public url {settings.websub_callback_url}"
+        )
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]):
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and (e := task.exception()):
+                logger.error(f"websub task error: {e!r}", exc_info=e)
+
+        # the loop only keeps weak references to tasks
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(done)
+
+    def callback_url(self, websub: WebSubscription) -> str:
+        assert settings.websub_callback_url
+        return f"{settings.websub_callback_url.rstrip('/')}/websub/{websub.id}"
+
+    def pushes(self, url: str, feed: FetchFeedResponse, websub: WebSubscription | None) -> bool:
+        """
+        Whether the hub of a polled feed pushes its updates, subscribe to the hub if not subscribed there yet.
+        """
+        if feed.hub and url not in self._subscribing:
+            topic = feed.topic or url
+            if websub is None or (websub.hub, websub.topic) != (feed.hub, topic):
+                self.spawn(self.subscribe(url, feed.hub, topic))
+                return False
+        return bool(websub and websub.lease_expires_at and websub.lease_expires_at > datetime.utcnow())
+
+    async def subscribe(self, url: str, hub: str, topic: str, secret: str | None = None):
+        """
+        Ask a hub to push a feed, the hub confirms by calling back. A renewal keeps the secret,
+        pushes signed with it keep coming until the hub verified the renewal.
+        """
+        self._subscribing.add(url)
+        try:
+            websub = await save_websub(url, hub, topic, secret or secrets.token_hex(20))
+            error = await self.poller.http_service.request_websub(
+                hub,
+                {
+                    "hub.callback": self.callback_url(websub),
+                    "hub.mode": "subscribe",
+                    "hub.topic": topic,
+                    "hub.lease_seconds": str(settings.websub_lease_seconds),
+                    "hub.secret": websub.secret,
+                },
+            )
+        finally:
+            self._subscribing.discard(url)
+        if error:
+            # polling goes on as before, the subscription is asked again after the retry interval
+            logger.warning(f"websub hub {hub} refused the subscription of {url}: {error}")
+        else:
+            logger.info(f"websub subscription of {url} requested at {hub}")
+
+    async def renew(self):
+        while True:
+            now = datetime.utcnow()
+            try:
+                for websub in await get_websubs_to_renew(
+                    now + timedelta(seconds=settings.websub_renew_margin),
+                    now - timedelta(seconds=settings.websub_retry_interval),
+                ):
+                    await self.subscribe(websub.url, websub.hub, websub.topic, websub.secret)
+            except Exception as e:  # keep renewing, the next check tries again
+                logger.error(f"websub renewal error: {e}", exc_info=True)
+            await asyncio.sleep(RENEW_CHECK_INTERVAL)
+
+    async def verify(self, request: web.Request) -> web.Response:
+        """
+        Answer the hub's verification of a subscription request with its challenge.
+        """
+        query = request.query
+        websub = await get_websub(int(request.match_info["id"]))
+        if websub is None or websub.id is None or query.get("hub.topic") != websub.topic:
+            return web.Response(status=404)
+        mode = query.get("hub.mode")
+        if mode == "denied":
+            logger.warning(
+                f"websub hub {websub.hub} denied the subscription of {websub.url}: {query.get('hub.reason')}"
+            )
+            await update_websub(websub.id, lease_expires_at=None, requested_at=datetime.utcnow())
+            return web.Response()
+        if mode != "subscribe" or "hub.challenge" not in query:
+            # nothing is unsubscribed from here, an unknown callback is answered with 410 instead
+            return web.Response(status=404)
+
+        lease_seconds = query.get("hub.lease_seconds", "")
+        lease_expires_at = datetime.utcnow() + timedelta(
+            seconds=int(lease_seconds) if lease_seconds.isdigit() else settings.websub_lease_seconds
+        )
+        await update_websub(websub.id, lease_expires_at=lease_expires_at)
+        logger.info(f"websub subscription of {websub.url} verified until {lease_expires_at}")
+        return web.Response(text=query["hub.challenge"])
+
+    async def receive(self, request: web.Request) -> web.Response:
+        websub = await get_websub(int(request.match_info["id"]))
+        if websub is None:
+            # the feed was unsubscribed, 410 tells the hub to stop pushing it
+            return web.Response(status=410)
+        body = await request.read()
+        if not signature_matches(websub.secret, request.headers.get("X-Hub-Signature"), body):
+            # still a 2xx, the hub must not learn whether a signature was right
+            logger.warning(f"ignored a websub push of {websub.url} with a wrong signature")
+            WEBSUB_PUSHES.inc(result="bad_signature")
+            return web.Response(status=202)
+        # answer right away, hubs time out slow callbacks
+        self.spawn(self.deliver(websub.url, body, request.headers.get("Content-Type")))
+        return web.Response(status=202)
+
+    async def deliver(self, url: str, body: bytes, content_type: str | None):
+        """
+        Post the new entries of a pushed feed to the subscribed channels.
+        """
+        now = datetime.utcnow()
+        leased = await lease_url(settings.worker_id, url, now, now + timedelta(seconds=settings.feed_lease_ttl))
+        if not leased:
+            # a poller is fetching the url right now, or nobody is subscribed anymore
+            logger.info(f"skipped a websub push of {url}, the feed is leased")
+            WEBSUB_PUSHES.inc(result="leased")
+            return
+
+        updates = FeedUpdates()
+        try:
+            parsed = await self.poller.http_service.parse_feed(body, content_type)
+            if not parsed or not parsed.get("version"):
+                logger.warning(f"websub push of {url} is not a valid feed")
+                WEBSUB_PUSHES.inc(result="invalid")
+                return
+            subscriptions = [(await self.poller.channels.resolve(_feed.channel_id), _feed) for _feed in leased]
+            seen = await get_seen_entries([url])
+            self.poller.post_new_entries(url, subscriptions, seen[url], parsed, updates)
+            WEBSUB_PUSHES.inc(result="delivered")
+        finally:
+            # the poll schedule is left as it is, only the lease is released
+            for _feed in leased:
+                updates.add(_feed.id, lease_owner=None, lease_expires_at=None)
+            await updates.flush()
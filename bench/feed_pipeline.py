@@ -0,0 +1,276 @@
+"""
+Offline benchmark of the feed pipeline against a local fake feed server.
+
+It measures HTTPService.fetch_feed on its own and then full FeedPoller cycles with a throwaway
+SQLite database and a fake discord client:
+
+    python -m bench.feed_pipeline --feeds 2000 --channels 20 --cycles 3 --latency 0.05
+    python -m bench.feed_pipeline --feeds 2000 --json bench_output.json
+    python -m bench.feed_pipeline --feeds 2000 --baseline bench_output.json
+
+With --baseline the results are compared with a previous --json run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from bench.feed_server import FeedServer, add_arguments, options_from_args
+
+# the app reads its settings at import time
+os.environ.setdefault("DISCORD_BOT_TOKEN", "bench")
+# always a throwaway database, the benchmark drops all tables, and DATABASE_URL may be set to a real one
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+os.environ.setdefault("FEED_CACHE_TTL", "0")  # cycles follow each other within seconds, all must reach the server
+
+
+@dataclass
+class Result:
+    name: str
+    seconds: float = 0.0
+    fetches: int = 0
+    fetches_per_second: float = 0.0
+    not_modified: int = 0
+    errors: int = 0
+    parse_seconds: float = 0.0
+    bytes_downloaded: int = 0
+    db_queries: int = 0
+    messages: int = 0
+
+
+@dataclass
+class Report:
+    results: list[Result] = field(default_factory=list)
+    peak_rss_mb: float = 0.0
+
+
+class BenchChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages = 0
+
+    async def send(self, content: Any = None, **kwargs: Any):
+        self.messages += 1
+
+
+class BenchClient:
+    """
+    Stand-in for the discord client, every channel is in the "gateway cache".
+    """
+
+    def __init__(self):
+        self.channels: dict[int, BenchChannel] = {}
+
+    def get_channel(self, channel_id: int) -> BenchChannel:
+        return self.channels.setdefault(channel_id, BenchChannel(channel_id))
+
+    async def fetch_channel(self, channel_id: int) -> BenchChannel:
+        return self.get_channel(channel_id)
+
+    def is_closed(self) -> bool:
+        return False
+
+    @property
+    def messages(self) -> int:
+        return sum(channel.messages for channel in self.channels.values())
+
+
+def timed_http_service():
+    from app.services.http_api import HTTPService
+
+    class TimedHTTPService(HTTPService):
+        parse_seconds = 0.0
+
+        async def parse_feed(self, data: bytes, content_type: str | None = None) -> Any:
+            start = time.perf_counter()
+            try:
+                return await super().parse_feed(data, content_type)
+            finally:
+                TimedHTTPService.parse_seconds += time.perf_counter() - start
+
+    return TimedHTTPService()
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self.increment)
+
+    def increment(self, *args: Any):
+        self.count += 1
+
+
+async def setup_database(server: FeedServer, channels: int):
+    from sqlmodel import SQLModel, insert
+
+    from app import database
+    from app.database import async_session
+    from app.models.feed import Feed
+
+    await database.start_database()
+    assert database.engine
+    async with database.engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(SQLModel.metadata.create_all)
+    rows = [
+        {"title": f"Feed {n}", "url": server.url(n), "channel_id": channel_id, "last_checked": datetime.utcnow()}
+        for n in range(server.options.feeds)
+        for channel_id in range(1, channels + 1)
+        if n % channels < channel_id  # popular feeds are subscribed in more channels
+    ]
+    async with async_session() as session:
+        await session.exec(insert(Feed), params=rows)  # type: ignore
+        await session.commit()
+    return len(rows)
+
+
+async def bench_fetch(server: FeedServer) -> Result:
+    from app.config.settings import settings
+    from app.services.http_api import FetchLimiter
+
+    http_service = timed_http_service()
+    limiter = FetchLimiter(settings.feed_fetch_concurrency, settings.feed_fetch_per_host_concurrency)
+    bytes_sent = server.bytes_sent
+
+    async def fetch(url: str):
+        async with limiter.acquire(url):
+            return await http_service.fetch_feed(url)
+
+    await http_service.start()
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(fetch(server.url(n)) for n in range(server.options.feeds)))
+    seconds = time.perf_counter() - start
+    await http_service.close()
+    return Result(
+        name="fetch_feed",
+        seconds=seconds,
+        fetches=len(responses),
+        fetches_per_second=len(responses) / seconds,
+        errors=sum(1 for r in responses if r.error),
+        parse_seconds=http_service.parse_seconds,
+        bytes_downloaded=server.bytes_sent - bytes_sent,
+    )
+
+
+async def bench_cycles(server: FeedServer, cycles: int) -> list[Result]:
+    from sqlmodel import update
+
+    from app import database
+    from app.database import async_session
+    from app.models.feed import Feed
+    from app.services.poller import FeedPoller
+
+    client = BenchClient()
+    http_service = timed_http_service()
+    poller = FeedPoller(client, http_service)  # type: ignore
+    queries = QueryCounter(database.engine)
+    results = []
+    await http_service.start()
+    for cycle in range(1, cycles + 1):
+        if cycle > 1:
+            server.advance()
+        # every feed is due, a cycle polls the whole table like the old fixed sweep did
+        async with async_session() as session:
+            await session.exec(update(Feed).values(next_poll_at=datetime.utcnow()))  # type: ignore
+            await session.commit()
+
+        requests, not_modified, bytes_sent = server.requests, server.not_modified, server.bytes_sent
+        parse_seconds, query_count, messages = http_service.parse_seconds, queries.count, client.messages
+        start = time.perf_counter()
+        await poller.poll()
+        seconds = time.perf_counter() - start
+        await asyncio.sleep(0.1)  # let the delivery queue drain the first messages
+        fetches = server.requests - requests
+        results.append(
+            Result(
+                name=f"cycle {cycle}",
+                seconds=seconds,
+                fetches=fetches,
+                fetches_per_second=fetches / seconds,
+                not_modified=server.not_modified - not_modified,
+                parse_seconds=http_service.parse_seconds - parse_seconds,
+                bytes_downloaded=server.bytes_sent - bytes_sent,
+                db_queries=queries.count - query_count,
+                messages=client.messages - messages,
+            )
+        )
+    await http_service.close()
+    return results
+
+
+def print_report(report: Report, baseline: Report | None = None):
+    columns = [
+        "seconds",
+        "fetches",
+        "fetches_per_second",
+        "not_modified",
+        "errors",
+        "parse_seconds",
+        "bytes_downloaded",
+        "db_queries",
+        "messages",
+    ]
+    print(f"{'':<12}" + "".join(f"{c:>20}" for c in columns))
+    previous = {r.name: r for r in baseline.results} if baseline else {}
+    for result in report.results:
+        print(f"{result.name:<12}" + "".join(f"{format_value(getattr(result, c)):>20}" for c in columns))
+        if before := previous.get(result.name):
+            print(
+                f"{'  vs base':<12}" + "".join(f"{change(getattr(before, c), getattr(result, c)):>20}" for c in columns)
+            )
+    print(f"peak rss: {report.peak_rss_mb:.1f} MiB")
+    if baseline:
+        print(f"peak rss vs base: {change(baseline.peak_rss_mb, report.peak_rss_mb)}")
+
+
+def format_value(value: float) -> str:
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def change(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.1f}%" if before else "-"
+
+
+async def run(args: argparse.Namespace) -> Report:
+    server = FeedServer(options_from_args(args), port=args.port)
+    await server.start()
+    try:
+        subscriptions = await setup_database(server, args.channels)
+        print(f"{server.options.feeds} feeds, {subscriptions} subscriptions in {args.channels} channels")
+        report = Report(results=[await bench_fetch(server)])
+        report.results.extend(await bench_cycles(server, args.cycles))
+    finally:
+        await server.stop()
+    report.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on linux
+    return report
+
+
+def load_report(path: str) -> Report:
+    with open(path) as f:
+        data = json.load(f)
+    return Report(results=[Result(**r) for r in data["results"]], peak_rss_mb=data["peak_rss_mb"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the feed pipeline against a local fake feed server")
+    add_arguments(parser)
+    parser.add_argument("--channels", type=int, default=10, help="discord channels subscribing to the feeds")
+    parser.add_argument("--cycles", type=int, default=3, help="poll cycles, the server advances between them")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with the results of an earlier --json run")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report, load_report(args.baseline) if args.baseline else None)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(asdict(report), f, indent=2)
@@ -0,0 +1,156 @@
+"""
+Local fake feed server for benchmarks, serving any number of synthetic RSS and Atom feeds.
+
+    python -m bench.feed_server --feeds 5000 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass, field
+from email.utils import formatdate
+
+from aiohttp import web
+
+
+@dataclass
+class FeedServerOptions:
+    feeds: int = 1000
+    entries: int = 20  # entries per feed
+    entry_size: int = 500  # bytes of summary text per entry
+    latency: float = 0.0  # seconds before each response
+    error_rate: float = 0.0  # share of requests answered with a 500
+    etag: bool = True  # send validators and answer conditional requests with 304
+    change_rate: float = 0.1  # share of feeds getting a new entry on every advance()
+    atom_ratio: float = 0.5  # share of feeds served as Atom instead of RSS
+    hub: str | None = None  # websub hub advertised by every feed, see bench.websub_hub
+
+
+@dataclass
+class FeedServer:
+    options: FeedServerOptions
+    host: str = "127.0.0.1"
+    port: int = 8765
+    versions: list[int] = field(default_factory=list)
+    requests: int = 0
+    not_modified: int = 0
+    bytes_sent: int = 0
+
+    def __post_init__(self):
+        self.versions = [0] * self.options.feeds
+        self._runner: web.AppRunner | None = None
+
+    def url(self, n: int) -> str:
+        return f"http://{self.host}:{self.port}/feeds/{n}.xml"
+
+    def advance(self):
+        """
+        Publish a new entry in `change_rate` of the feeds.
+        """
+        for n in random.sample(range(self.options.feeds), int(self.options.feeds * self.options.change_rate)):
+            self.versions[n] += 1
+
+    def render(self, n: int) -> bytes:
+        version, options = self.versions[n], self.options
+        summary = "x" * options.entry_size
+        links = ""
+        if options.hub:
+            links = f'<atom:link rel="hub" href="{options.hub}"/><atom:link rel="self" href="{self.url(n)}"/>'
+        newest_first = range(version + options.entries - 1, version - 1, -1)
+        if n < options.feeds * options.atom_ratio:
+            entries = "".join(
+                f"<entry><id>urn:feed:{n}:{i}</id><title>Entry {i}</title>"
+                f'<link href="http://example.com/{n}/{i}"/>'
+                f"<updated>{formatdate(1_700_000_000 + i * 3600, usegmt=True)}</updated>"
+                f"<summary>{summary}</summary></entry>"
+                for i in newest_first
+            )
+            document = (
+                f'<feed xmlns="http://www.w3.org/2005/Atom" xmlns:atom="http://www.w3.org/2005/Atom">'
+                f"<title>Feed {n}</title>{links}{entries}</feed>"
+            )
+        else:
+            entries = "".join(
+                f"<item><guid>urn:feed:{n}:{i}</guid><title>Entry {i}</title>"
+                f"<link>http://example.com/{n}/{i}</link>"
+                f"<pubDate>{formatdate(1_700_000_000 + i * 3600, usegmt=True)}</pubDate>"
+                f"<description>{summary}</description></item>"
+                for i in newest_first
+            )
+            document = (
+                f'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+                f"<channel><title>Feed {n}</title>{links}{entries}</channel></rss>"
+            )
+        return b'<?xml version="1.0" encoding="utf-8"?>' + document.encode()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.options.latency:
+            await asyncio.sleep(self.options.latency)
+        if random.random() < self.options.error_rate:
+            return web.Response(status=500)
+        n = int(request.match_info["n"])
+        if n >= self.options.feeds:
+            return web.Response(status=404)
+
+        headers = {}
+        if self.options.etag:
+            headers["ETag"] = etag = f'"{n}-{self.versions[n]}"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers=headers)
+        body = self.render(n)
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/xml", headers=headers)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/feeds/{n:\\d+}.xml", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    defaults = FeedServerOptions()
+    parser.add_argument("--feeds", type=int, default=defaults.feeds)
+    parser.add_argument("--entries", type=int, default=defaults.entries)
+    parser.add_argument("--entry-size", type=int, default=defaults.entry_size)
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--no-etag", dest="etag", action="store_false")
+    parser.add_argument("--change-rate", type=float, default=defaults.change_rate)
+    parser.add_argument("--atom-ratio", type=float, default=defaults.atom_ratio)
+    parser.add_argument("--hub", help="websub hub url advertised by the feeds")
+    parser.add_argument("--port", type=int, default=8765)
+
+
+def options_from_args(args: argparse.Namespace) -> FeedServerOptions:
+    return FeedServerOptions(
+        feeds=args.feeds,
+        entries=args.entries,
+        entry_size=args.entry_size,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        etag=args.etag,
+        change_rate=args.change_rate,
+        atom_ratio=args.atom_ratio,
+        hub=args.hub,
+    )
+
+
+async def serve_forever(server: FeedServer):
+    await server.start()
+    print(f"serving {server.options.feeds} feeds at {server.url(0)} ...")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="serve synthetic feeds for benchmarks")
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(serve_forever(FeedServer(options_from_args(args), port=args.port)))
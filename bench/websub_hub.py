@@ -0,0 +1,188 @@
+"""
+Local stand-in websub hub, with a demo measuring push delivery through the subscriber:
+
+    python -m bench.websub_hub --feeds 200 --channels 5
+
+The feeds of the fake feed server advertise the hub, one poll cycle subscribes to all of them,
+then every feed gets a new entry that is pushed to the subscriber instead of being polled.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+
+import aiohttp
+from aiohttp import web
+
+from bench.feed_server import FeedServer, add_arguments, options_from_args
+
+os.environ.setdefault("WEBSUB_CALLBACK_URL", "http://127.0.0.1:8090")
+
+
+@dataclass
+class Subscription:
+    callback: str
+    secret: str | None
+    lease_seconds: int
+
+
+@dataclass
+class WebSubHub:
+    """
+    Accept subscription requests with 202, verify them with a challenge afterwards like a real hub,
+    and push published content to the verified callbacks of a topic.
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 8766
+    subscriptions: dict[str, dict[str, Subscription]] = field(default_factory=dict)  # topic -> callback -> sub
+    requests: int = 0
+    denied: int = 0
+    pushes: int = 0
+
+    def __post_init__(self):
+        self._runner: web.AppRunner | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/hub"
+
+    @property
+    def verified(self) -> int:
+        return sum(len(callbacks) for callbacks in self.subscriptions.values())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        form = await request.post()
+        if form.get("hub.mode") != "subscribe" or not form.get("hub.callback") or not form.get("hub.topic"):
+            return web.Response(status=400)
+        task = asyncio.create_task(
+            self.verify(
+                str(form["hub.topic"]),
+                Subscription(
+                    callback=str(form["hub.callback"]),
+                    secret=str(form["hub.secret"]) if form.get("hub.secret") else None,
+                    lease_seconds=int(str(form.get("hub.lease_seconds") or 86400)),
+                ),
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response(status=202)
+
+    async def verify(self, topic: str, subscription: Subscription):
+        assert self._session
+        challenge = secrets.token_hex(8)
+        params = {
+            "hub.mode": "subscribe",
+            "hub.topic": topic,
+            "hub.challenge": challenge,
+            "hub.lease_seconds": str(subscription.lease_seconds),
+        }
+        async with self._session.get(subscription.callback, params=params) as resp:
+            if resp.status == 200 and await resp.text() == challenge:
+                self.subscriptions.setdefault(topic, {})[subscription.callback] = subscription
+            else:
+                self.denied += 1
+
+    async def publish(self, topic: str, body: bytes, content_type: str = "application/xml"):
+        """
+        Push new content of a topic to its subscribers, signed with their secrets.
+        """
+        assert self._session
+        for callback, subscription in list(self.subscriptions.get(topic, {}).items()):
+            headers = {"Content-Type": content_type, "Link": f'<{self.url}>; rel="hub", <{topic}>; rel="self"'}
+            if subscription.secret:
+                digest = hmac.new(subscription.secret.encode(), body, hashlib.sha256).hexdigest()
+                headers["X-Hub-Signature"] = f"sha256={digest}"
+            async with self._session.post(callback, data=body, headers=headers) as resp:
+                self.pushes += 1
+                if resp.status == 410:  # the subscriber is gone
+                    del self.subscriptions[topic][callback]
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        app = web.Application()
+        app.router.add_post("/hub", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()
+        if self._session:
+            await self._session.close()
+
+
+async def wait_for(condition, timeout: float) -> float:
+    start = time.perf_counter()
+    while not condition() and time.perf_counter() - start < timeout:
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+async def run(args: argparse.Namespace):
+    from bench.feed_pipeline import BenchClient, setup_database, timed_http_service
+
+    from app.services.metrics import WEBSUB_PUSHES
+    from app.services.poller import FeedPoller
+
+    hub = WebSubHub(port=args.hub_port)
+    options = options_from_args(args)
+    options.hub = hub.url
+    server = FeedServer(options, port=args.port)
+    await asyncio.gather(hub.start(), server.start())
+    client = BenchClient()
+    http_service = timed_http_service()
+    poller = FeedPoller(client, http_service)  # type: ignore
+    assert poller.websub
+    try:
+        subscriptions = await setup_database(server, args.channels)
+        print(f"{options.feeds} feeds, {subscriptions} subscriptions in {args.channels} channels")
+        await asyncio.gather(http_service.start(), poller.websub.start())
+
+        start = time.perf_counter()
+        await poller.poll()
+        seconds = await wait_for(lambda: hub.verified + hub.denied >= options.feeds, args.timeout)
+        print(
+            f"subscribed: {hub.verified} verified, {hub.denied} denied, {hub.requests} requests "
+            f"in {time.perf_counter() - start:.3f}s, {seconds:.3f}s after the poll cycle"
+        )
+
+        server.advance()
+        delivered = lambda: sum(WEBSUB_PUSHES.values.values())  # noqa: E731
+        pushed, requests, messages = delivered(), server.requests, client.messages
+        start = time.perf_counter()
+        for n in range(options.feeds):
+            await hub.publish(server.url(n), server.render(n))
+        seconds = await wait_for(lambda: delivered() - pushed >= hub.pushes, args.timeout)
+        await asyncio.sleep(0.1)  # let the delivery queue drain the first messages
+        print(
+            f"pushed {hub.pushes} updates, all handled in {seconds:.3f}s, "
+            f"{(time.perf_counter() - start) / max(hub.pushes, 1) * 1000:.2f}ms per push; "
+            f"{client.messages - messages} messages, {server.requests - requests} feed fetches"
+        )
+        print({dict(labels)["result"]: value for labels, value in WEBSUB_PUSHES.values.items()})
+    finally:
+        await poller.websub.close()
+        await http_service.close()
+        await asyncio.gather(hub.stop(), server.stop())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="push feed updates through a local websub hub")
+    add_arguments(parser)
+    parser.add_argument("--channels", type=int, default=5, help="discord channels subscribing to the feeds")
+    parser.add_argument("--hub-port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for verifications and pushes")
+    parser.set_defaults(feeds=200, change_rate=1.0)
+    asyncio.run(run(parser.parse_args()))
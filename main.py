@@ -1,4 +1,6 @@
 import logging
+import sys
+import time
 
 import dotenv
 
@@ -11,6 +13,12 @@ if __name__ == "__main__":
         format="[%(asctime)s] [%(levelname)s] [%(name)s:%(lineno)s] %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
-    from app.services.discord_bot import start
+    logger = logging.getLogger("main")
+    started_at = time.perf_counter()
+    if sys.argv[1:] == ["poller"]:  # a feed poller worker without the discord bot
+        from app.services.poller import start_worker as start
+    else:
+        from app.services.discord_bot import start
+    logger.info(f"modules imported in {time.perf_counter() - started_at:.3f}s")
 
     start()
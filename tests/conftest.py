@@ -0,0 +1,27 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# the app reads its settings at import time, tests always get a throwaway database
+os.environ.setdefault("DISCORD_BOT_TOKEN", "test")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+
+
+@pytest.fixture
+def db():
+    from sqlmodel import SQLModel
+
+    from app import database
+
+    async def setup():
+        await database.start_database()
+        assert database.engine
+        async with database.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    asyncio.run(setup())
+    yield
+    asyncio.run(database.close_database())
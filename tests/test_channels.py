@@ -0,0 +1,41 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import nextcord
+
+from app.services.channels import ChannelResolver
+
+
+class FlakyClient:
+    def __init__(self, error: Exception):
+        self.error: Exception | None = error
+        self.fetches = 0
+
+    def get_channel(self, channel_id: int) -> Any:
+        return None
+
+    async def fetch_channel(self, channel_id: int) -> Any:
+        self.fetches += 1
+        if self.error:
+            raise self.error
+        return SimpleNamespace(id=channel_id)
+
+
+def test_discord_error_skips_the_channel_without_caching_it():
+    client = FlakyClient(nextcord.HTTPException(SimpleNamespace(status=503, reason="Service Unavailable"), "down"))
+    resolver = ChannelResolver(client)  # type: ignore
+
+    assert asyncio.run(resolver.resolve(1)) is None
+    client.error = None
+    assert asyncio.run(resolver.resolve(1)).id == 1
+    assert client.fetches == 2
+
+
+def test_missing_channel_is_cached():
+    client = FlakyClient(nextcord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "gone"))
+    resolver = ChannelResolver(client)  # type: ignore
+
+    assert asyncio.run(resolver.resolve(1)) is None
+    assert asyncio.run(resolver.resolve(1)) is None
+    assert client.fetches == 1
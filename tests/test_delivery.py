@@ -0,0 +1,25 @@
+import pytest
+
+from app.services import delivery
+from app.services.delivery import MESSAGE_LIMIT, TokenBucket, combine
+
+
+def test_token_bucket_allows_a_burst_then_paces(monkeypatch: pytest.MonkeyPatch):
+    now = [100.0]
+    monkeypatch.setattr(delivery.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=3)
+
+    assert [bucket.delay() for _ in range(3)] == [0, 0, 0]
+    assert bucket.delay() == pytest.approx(0.5)
+    now[0] += 0.5
+    assert bucket.delay() == 0
+    # tokens do not pile up beyond the capacity while idle
+    now[0] += 60
+    assert [bucket.delay() for _ in range(4)][-1] > 0
+
+
+def test_combine_joins_lines_up_to_the_limit():
+    assert combine(["a", "b"]) == ["a\nb"]
+    line = "x" * (MESSAGE_LIMIT // 2)
+    assert combine([line, line, "y"]) == [line, line + "\ny"]
+    assert combine(["z" * (MESSAGE_LIMIT + 10)]) == ["z" * MESSAGE_LIMIT]
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.services.feed import FeedUpdates, lease_due_feeds, lease_url, subscribe_feed
+
+
+def test_lease_returns_only_the_rows_it_took(db: None):
+    async def run():
+        await subscribe_feed("Feed", "http://example.com/a.xml", 1)
+        await subscribe_feed("Feed", "http://example.com/a.xml", 2)
+        now = datetime.utcnow() + timedelta(seconds=1)
+        expires_at = now + timedelta(minutes=10)
+
+        polled = await lease_due_feeds("bot-1", now, expires_at, 10)
+        assert {_feed.channel_id for _feed in polled} == {1, 2}
+        # a push of the url with the same owner must not get the rows being polled, nor another poll
+        assert await lease_url("bot-1", "http://example.com/a.xml", now, expires_at) == []
+        assert await lease_due_feeds("bot-1", now, expires_at, 10) == []
+        # an expired lease is taken over
+        later = expires_at + timedelta(seconds=1)
+        pushed = await lease_url("bot-1", "http://example.com/a.xml", later, later + timedelta(minutes=10))
+        assert len(pushed) == 2
+
+    asyncio.run(run())
+
+
+def test_lease_takes_every_subscription_of_a_due_url(db: None):
+    async def run():
+        now = datetime.utcnow() + timedelta(seconds=1)
+        first = await subscribe_feed("Feed", "http://example.com/a.xml", 1)
+        assert first.feed
+        updates = FeedUpdates()
+        updates.add(first.feed.id, next_poll_at=now + timedelta(hours=1))
+        await updates.flush()
+        await subscribe_feed("Feed", "http://example.com/a.xml", 2)
+
+        leased = await lease_due_feeds("bot-1", now, now + timedelta(minutes=10), 10)
+        assert {_feed.channel_id for _feed in leased} == {1, 2}
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+import asyncio
+
+import feedparser  # type: ignore
+import pytest
+
+from app.config.settings import settings
+from app.services.http_api import FetchFeedResponse, HTTPService, truncate_entries
+
+RSS = b'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>%s</channel></rss>'
+ATOM = b'<feed xmlns="http://www.w3.org/2005/Atom"><title>t</title>%s</feed>'
+
+
+def test_truncate_entries_keeps_the_first_items():
+    items = b"".join(b"<item><guid>%d</guid></item>" % i for i in range(5))
+    feed = feedparser.parse(truncate_entries(RSS % items, 2))
+    assert not feed.bozo
+    assert [entry.id for entry in feed.entries] == ["0", "1"]
+
+    entries = b"".join(b"<entry><id>%d</id></entry>" % i for i in range(5))
+    feed = feedparser.parse(truncate_entries(ATOM % entries, 3))
+    assert not feed.bozo
+    assert [entry.id for entry in feed.entries] == ["0", "1", "2"]
+
+
+def test_truncate_entries_leaves_short_feeds_alone():
+    data = RSS % b"<item><guid>0</guid></item>"
+    assert truncate_entries(data, 1) == data
+    assert truncate_entries(b"not a feed", 1) == b"not a feed"
+
+
+class CountingHTTPService(HTTPService):
+    def __init__(self, response: FetchFeedResponse):
+        super().__init__()
+        self.response = response
+        self.requests = 0
+
+    async def request_feed(self, url: str, etag: str | None = None, last_modified: str | None = None):
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return self.response
+
+
+def test_concurrent_fetches_share_one_request(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_cache_ttl", 60)
+    http = CountingHTTPService(FetchFeedResponse(feed={"entries": []}, etag='"1"'))
+
+    async def run():
+        responses = await asyncio.gather(*(http.fetch_feed("http://example.com/feed") for _ in range(3)))
+        assert all(response is http.response for response in responses)
+        # answered from the cache, a 304 for callers that already have the validators
+        assert await http.fetch_feed("http://example.com/feed") is http.response
+        assert (await http.fetch_feed("http://example.com/feed", etag='"1"')).not_modified
+
+    asyncio.run(run())
+    assert http.requests == 1
+
+
+def test_errors_are_not_cached(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_cache_ttl", 60)
+    http = CountingHTTPService(FetchFeedResponse(error="HTTP 500"))
+
+    async def run():
+        await http.fetch_feed("http://example.com/feed")
+        await http.fetch_feed("http://example.com/feed")
+
+    asyncio.run(run())
+    assert http.requests == 2
+
+
+def test_cache_expires_and_is_bounded(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_cache_ttl", 0.05)
+    monkeypatch.setattr(settings, "feed_cache_size", 2)
+    http = CountingHTTPService(FetchFeedResponse(feed={"entries": []}))
+
+    async def run():
+        await http.fetch_feed("http://example.com/a")
+        await asyncio.sleep(0.1)
+        await http.fetch_feed("http://example.com/a")
+        assert http.requests == 2
+        await http.fetch_feed("http://example.com/b")
+        await http.fetch_feed("http://example.com/c")
+        assert len(http._feed_cache) == 2
+
+    asyncio.run(run())
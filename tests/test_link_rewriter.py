@@ -0,0 +1,34 @@
+import pytest
+
+from app.config.settings import settings
+from app.services.link_rewriter import TWITTER, LinkRewriter, LinkRule
+
+
+@pytest.fixture
+def rewriter() -> LinkRewriter:
+    return LinkRewriter([TWITTER, LinkRule(domains=("instagram.com",), target="ddinstagram.com")])
+
+
+def test_rewrites_links_of_every_rule(rewriter: LinkRewriter):
+    text = "look https://x.com/jack/status/20 and https://www.instagram.com/p/abc/ too"
+    assert rewriter.rewrite(1, text) == [
+        ":bird: [Tweet • jack](https://fxtwitter.com/jack/status/20)",
+        ":link: [instagram.com](https://ddinstagram.com/p/abc/)",
+    ]
+
+
+def test_ignores_other_links(rewriter: LinkRewriter):
+    assert rewriter.rewrite(1, "no links here") == []
+    assert rewriter.rewrite(1, "https://x.com/jack is a profile, https://example.com/p/abc") == []
+
+
+def test_same_link_is_rewritten_once_per_channel(rewriter: LinkRewriter, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "link_rewrite_ttl", 600)
+    link = "https://twitter.com/jack/status/20"
+    assert len(rewriter.rewrite(1, link)) == 1
+    assert rewriter.rewrite(1, link) == []
+    assert len(rewriter.rewrite(2, link)) == 1
+
+
+def test_no_rules():
+    assert LinkRewriter([]).rewrite(1, "https://x.com/jack/status/20") == []
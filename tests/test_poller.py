@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from typing import Any
+
+import pytest
+from sqlalchemy import event
+from sqlmodel import func, select, update
+
+from app import database
+from app.config.settings import settings
+from app.database import async_session
+from app.models.feed import Feed, FeedEntry
+from app.services.feed import lease_due_feeds, subscribe_feed
+from app.services.http_api import FetchFeedResponse, parse_feed
+from app.services.poller import FeedPoller
+
+URL = "http://example.com/feed.xml"
+
+
+def render(entries: range) -> bytes:
+    items = "".join(
+        f"<item><guid>urn:entry:{i}</guid><title>Entry {i}</title><link>http://example.com/{i}</link>"
+        f"<pubDate>{formatdate(1_700_000_000 + i * 3600, usegmt=True)}</pubDate></item>"
+        for i in reversed(entries)
+    )
+    return f'<rss version="2.0"><channel><title>Feed</title>{items}</channel></rss>'.encode()
+
+
+class FakeClient:
+    def get_channel(self, channel_id: int) -> Any:
+        return channel_id
+
+    def is_closed(self) -> bool:
+        return False
+
+
+class FakeHTTPService:
+    def __init__(self):
+        self.body = b""
+
+    async def fetch_feed(self, url: str, etag: str | None = None, last_modified: str | None = None):
+        return FetchFeedResponse(feed=parse_feed(self.body))
+
+
+class FakeDelivery:
+    def __init__(self):
+        self.sent: list[str] = []
+
+    def send(self, channel: Any, content: str):
+        self.sent.append(content.rsplit("\n", 1)[-1])
+
+
+@pytest.fixture
+def poller(db: None):
+    poller = FeedPoller(FakeClient(), FakeHTTPService())  # type: ignore
+    poller.delivery = FakeDelivery()  # type: ignore
+    return poller
+
+
+def poll(poller: FeedPoller, entries: range) -> list[str]:
+    async def run():
+        async with async_session() as session:
+            await session.exec(update(Feed).values(next_poll_at=datetime.utcnow()))  # type: ignore
+            await session.commit()
+        await poller.poll()
+
+    poller.http_service.body = render(entries)  # type: ignore
+    sent = poller.delivery.sent = []  # type: ignore
+    asyncio.run(run())
+    return sent
+
+
+def test_unchanged_feed_over_retention_is_not_posted_again(poller: FeedPoller, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_seen_entries_retention", 5)
+    asyncio.run(subscribe_feed("Feed", URL, 1))
+
+    assert poll(poller, range(1, 5)) == []  # first poll, the entries are older than the subscription
+    assert poll(poller, range(2, 6)) == ["http://example.com/5"]
+    assert poll(poller, range(3, 7)) == ["http://example.com/6"]
+    # more hashes than the retention now, pruning must keep the entries still in the feed
+    assert poll(poller, range(3, 7)) == []
+    assert poll(poller, range(3, 7)) == []
+
+
+def test_unchanged_feed_does_not_prune_the_entry_index(poller: FeedPoller, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_entry_index_retention", 100)
+    asyncio.run(subscribe_feed("Feed", URL, 1))
+    assert database.engine
+    statements: list[str] = []
+    event.listen(database.engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    poll(poller, range(1, 151))
+    statements.clear()
+    poll(poller, range(1, 151))
+    assert not [statement for statement in statements if statement.startswith("DELETE")]
+
+    assert poll(poller, range(2, 152)) == ["http://example.com/151"]
+    assert [statement for statement in statements if statement.startswith("DELETE FROM feedentry")]
+
+    async def count() -> int:
+        async with async_session() as session:
+            return (await session.exec(select(func.count()).select_from(FeedEntry))).one()
+
+    assert asyncio.run(count()) == 100
+
+
+def test_long_cycle_keeps_its_leases(poller: FeedPoller, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "feed_lease_ttl", 0.3)
+    asyncio.run(subscribe_feed("Feed", URL, 1))
+    taken_over: list[Feed] = []
+
+    class SlowHTTPService(FakeHTTPService):
+        async def fetch_feed(self, url: str, etag: str | None = None, last_modified: str | None = None):
+            # longer than the lease ttl, another worker must not get the feed meanwhile
+            for _ in range(4):
+                await asyncio.sleep(0.2)
+                now = datetime.utcnow()
+                taken_over.extend(await lease_due_feeds("another-worker", now, now + timedelta(seconds=1), 10))
+            return await super().fetch_feed(url, etag, last_modified)
+
+    poller.http_service = SlowHTTPService()  # type: ignore
+    poll(poller, range(1, 5))
+    assert taken_over == []
@@ -0,0 +1,57 @@
+from datetime import datetime
+from email.utils import formatdate
+
+import feedparser  # type: ignore
+import pytest
+
+from app.config.settings import settings
+from app.services import scheduler
+from app.services.http_api import FetchFeedResponse
+from app.services.scheduler import next_poll_at, next_poll_interval
+
+
+def rss(seconds_apart: int, entries: int = 5, extra: str = "") -> FetchFeedResponse:
+    items = "".join(
+        f"<item><guid>{i}</guid><pubDate>{formatdate(1_700_000_000 + i * seconds_apart, usegmt=True)}</pubDate></item>"
+        for i in range(entries)
+    )
+    return FetchFeedResponse(feed=feedparser.parse(f'<rss version="2.0"><channel>{extra}{items}</channel></rss>'))
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(scheduler.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(settings, "feed_poll_min_interval", 300)
+    monkeypatch.setattr(settings, "feed_poll_max_interval", 6 * 3600)
+
+
+def test_interval_is_half_the_gap_between_entries():
+    assert next_poll_interval(rss(seconds_apart=2 * 3600), 300) == 3600
+
+
+def test_interval_is_within_bounds():
+    assert next_poll_interval(rss(seconds_apart=60), 300) == 300
+    assert next_poll_interval(rss(seconds_apart=48 * 3600), 300) == 6 * 3600
+    # without dated entries there is nothing to adapt to
+    assert next_poll_interval(rss(seconds_apart=3600, entries=1), 300) == 6 * 3600
+
+
+def test_ttl_and_cache_lifetime_stretch_the_interval():
+    assert next_poll_interval(rss(seconds_apart=3600, extra="<ttl>90</ttl>"), 300) == 90 * 60
+    feed = rss(seconds_apart=3600)
+    feed.max_age = 7200
+    assert next_poll_interval(feed, 300) == 7200
+
+
+def test_unchanged_feed_backs_off():
+    assert next_poll_interval(FetchFeedResponse(not_modified=True), 1000) == 1500
+    assert next_poll_interval(FetchFeedResponse(not_modified=True), 6 * 3600) == 6 * 3600
+
+
+def test_next_poll_at_skips_hours():
+    now = datetime(2024, 1, 1, 10, 30)
+    assert next_poll_at(now, 1800) == datetime(2024, 1, 1, 11, 0)
+    assert next_poll_at(now, 1800, [11, 12]) == datetime(2024, 1, 1, 13, 0)
+    assert next_poll_at(now, 60, [10]) == datetime(2024, 1, 1, 11, 0)
+    # a feed skipping every hour is polled anyway
+    assert next_poll_at(now, 60, list(range(24))) == datetime(2024, 1, 1, 10, 31)